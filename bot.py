@@ -1,17 +1,21 @@
 # bot.py (Versão com importação corrigida e integração de Webhooks)
 
+import asyncio
 import discord
 from discord import app_commands, Interaction, SelectOption, Color
 from discord.ext import commands
 from discord.ui import Select, View
 import os
+import re
 from dotenv import load_dotenv
 from typing import Optional
 import logging # <-- ADICIONADO: Para um sistema de log mais robusto
 
 # Módulos locais
-from notion_integration import NotionIntegration, NotionAPIError
+from notion_integration import AsyncNotionIntegration, NotionAPIError
 from config_utils import save_config, load_config
+from people_mapping import people_mapping
+from notion_mirror import NotionMirror
 from ui_components import (
     SelectView,
     PaginationView,
@@ -19,6 +23,7 @@ from ui_components import (
     CardModal,
     ManagementView,
 )
+from question_answering import ask
 from webhook_server import WebhookServer # <-- ADICIONADO: Para o servidor de webhooks
 
 # Carregar variáveis de ambiente e inicializar bot/notion
@@ -42,8 +47,24 @@ intents.message_content = True
 intents.guilds = True
 intents.messages = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-notion = NotionIntegration()
+class NotionBot(commands.Bot):
+    async def close(self):
+        """Encerra o servidor de webhooks e a sessão HTTP do Notion junto com o bot."""
+        try:
+            await webhook_handler.stop()
+        except Exception as e:
+            logging.error(f"Erro ao encerrar o servidor de webhooks: {e}", exc_info=True)
+        await super().close()
+        await notion.aclose()
+
+bot = NotionBot(command_prefix="!", intents=intents)
+MIRROR_SYNC_INTERVAL = float(os.getenv("NOTION_MIRROR_SYNC_INTERVAL", "300"))
+notion = AsyncNotionIntegration(people_mapping=people_mapping, mirror=NotionMirror())
+
+webhook_handler = WebhookServer(bot=bot, notion_integration=notion, port=int(os.getenv("WEBHOOK_PORT", "8080")))
+
+# Referências para tarefas em segundo plano (evita que sejam coletadas antes de terminar)
+background_tasks = set()
 
 
 # --- FUNÇÃO AUXILIAR DE CONFIGURAÇÃO ---
@@ -59,7 +80,9 @@ async def run_full_config_flow(interaction: Interaction, url: str, is_update: bo
         # Salva a URL inicial para garantir que o canal é reconhecido como configurado
         save_config(interaction.guild_id, config_channel_id, {'notion_url': url})
 
-        all_properties = notion.get_properties_for_interaction(url)
+        # Reconfigurar o canal deve sempre refletir o schema atual do Notion
+        notion.invalidate_schema(url)
+        all_properties = await notion.get_properties_for_interaction(url)
         property_names = [prop['name'] for prop in all_properties]
 
         async def run_selection_process(prompt_title, prompt_description, original_interaction):
@@ -126,10 +149,15 @@ async def on_ready():
         await bot.tree.sync()
         logging.info("Comandos sincronizados globalmente.")
 
+    # Sincronização periódica do espelho local das bases (iniciada uma única vez)
+    if not any(task.get_name() == "mirror-sync" for task in background_tasks):
+        task = asyncio.create_task(notion.mirror.run_periodic_sync(notion, MIRROR_SYNC_INTERVAL), name="mirror-sync")
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
     # --- ADICIONADO: Código para iniciar o servidor de Webhooks ---
     logging.info("Iniciando o servidor de Webhooks em segundo plano...")
-    webhook_handler = WebhookServer(bot=bot, notion_integration=notion)
-    webhook_handler.run()
+    await webhook_handler.start()
     # ----------------------------------------------------------------
 
     logging.info(f"✅ {bot.user} está online e pronto para uso!")
@@ -183,7 +211,7 @@ async def interactive_card(interaction: Interaction):
         if not config or 'notion_url' not in config:
             return await interaction.response.send_message("❌ O Notion ainda não foi configurado para este canal. Peça para um admin usar `/config`.", ephemeral=True)
 
-        all_properties = notion.get_properties_for_interaction(config['notion_url'])
+        all_properties = await notion.get_properties_for_interaction(config['notion_url'])
 
         thread_context = interaction.channel if isinstance(interaction.channel, discord.Thread) else None
         topic_title = thread_context.name if thread_context else None
@@ -235,7 +263,7 @@ async def interactive_search(interaction: Interaction):
         if not config or 'notion_url' not in config:
             return await interaction.response.send_message("❌ O Notion não foi configurado para este canal. Use `/config`.", ephemeral=True)
 
-        all_properties = notion.get_properties_for_interaction(config['notion_url'])
+        all_properties = await notion.get_properties_for_interaction(config['notion_url'])
         display_properties_names = config.get('display_properties', [])
         if not display_properties_names:
             return await interaction.response.send_message("❌ As propriedades para busca não foram configuradas. Use `/config`.", ephemeral=True)
@@ -269,15 +297,13 @@ async def interactive_search(interaction: Interaction):
                         async def callback(self, sub_inter: Interaction):
                             await sub_inter.response.defer(thinking=True, ephemeral=True)
                             search_term = self.values[0]
-                            cards = notion.search_in_database(config['notion_url'], search_term, selected_property['name'], selected_property['type'])
-                            results = cards.get('results', [])
-                            if not results:
+                            result_pages = notion.iter_search_pages(config['notion_url'], search_term, selected_property['name'], selected_property['type'])
+                            view = await PaginationView.from_result_pages(sub_inter.user, result_pages, config, notion, actions=['edit', 'delete', 'share'])
+                            if not view.results:
                                 return await sub_inter.followup.send(f"❌ Nenhum resultado para '{search_term}'.", ephemeral=True)
 
-                            await sub_inter.followup.send(f"✅ {len(results)} resultado(s) encontrado(s)!", ephemeral=True)
+                            await sub_inter.followup.send(f"✅ {view.total_label} resultado(s) encontrado(s)!", ephemeral=True)
 
-                            view = PaginationView(sub_inter.user, results, config, notion, actions=['edit', 'delete', 'share'])
-                            view.update_nav_buttons()
                             await sub_inter.followup.send(embed=await view.get_page_embed(), view=view, ephemeral=True)
 
                     view_options = View(timeout=120.0)
@@ -308,8 +334,31 @@ async def num_cards(interaction: Interaction):
         config = load_config(interaction.guild_id, config_channel_id)
         if not config or 'notion_url' not in config:
             return await interaction.response.send_message("❌ O Notion não foi configurado para este canal. Use `/config`.", ephemeral=True)
-        count = notion.get_database_count(config['notion_url'])
-        await interaction.response.send_message(f"📊 O banco de dados deste canal contém **{count}** cards.")
+        database_id = notion.extract_database_id(config['notion_url'])
+        cached_count = notion.count_cache.get(database_id) if database_id else None
+        if cached_count is not None:
+            return await interaction.response.send_message(f"📊 O banco de dados deste canal contém **{cached_count}** cards.")
+
+        # Bases grandes podem levar vários segundos: a contagem roda em segundo plano
+        # e a mensagem é atualizada com o progresso.
+        await interaction.response.send_message("⏳ Contando os cards do banco de dados...")
+
+        async def report_progress(partial_count: int):
+            await interaction.edit_original_response(content=f"⏳ Contando os cards do banco de dados... **{partial_count}** até agora.")
+
+        async def count_in_background():
+            try:
+                count = await notion.get_database_count(config['notion_url'], progress_callback=report_progress)
+                await interaction.edit_original_response(content=f"📊 O banco de dados deste canal contém **{count}** cards.")
+            except NotionAPIError as e:
+                await interaction.edit_original_response(content=f"❌ Erro ao acessar o Notion: {e}")
+            except Exception as e:
+                await interaction.edit_original_response(content=f"🔴 Erro inesperado: {e}")
+                logging.error(f"Erro inesperado no /num_cards: {e}", exc_info=True)
+
+        task = asyncio.create_task(count_in_background())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
     except NotionAPIError as e:
         await interaction.response.send_message(f"❌ Erro ao acessar o Notion: {e}", ephemeral=True)
     except Exception as e:
@@ -317,6 +366,55 @@ async def num_cards(interaction: Interaction):
         logging.error(f"Erro inesperado no /num_cards: {e}", exc_info=True)
 
 
+@bot.tree.command(name="vincular_notion", description="(Admin) Vincula um membro do Discord a um usuário do Notion.")
+@app_commands.describe(membro="Membro do Discord.", pessoa="Nome, e-mail ou ID do usuário no Notion. Deixe vazio para remover o vínculo.")
+@app_commands.checks.has_permissions(administrator=True)
+async def link_notion_user(interaction: Interaction, membro: discord.Member, pessoa: Optional[str] = None):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    try:
+        if not pessoa:
+            if people_mapping.remove(membro.id):
+                return await interaction.followup.send(f"✅ Vínculo de {membro.mention} com o Notion removido.", ephemeral=True)
+            return await interaction.followup.send(f"ℹ️ {membro.mention} não possui vínculo com o Notion.", ephemeral=True)
+
+        if re.fullmatch(r"[a-f0-9]{8}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{4}-[a-f0-9]{12}", pessoa.strip().lower()):
+            notion_user_id = pessoa.strip().lower()
+        else:
+            notion_user_id = await notion.search_id_person(pessoa)
+        if not notion_user_id:
+            return await interaction.followup.send(f"❌ Nenhum usuário do Notion encontrado para '{pessoa}'.", ephemeral=True)
+
+        people_mapping.set(membro.id, notion_user_id, manual=True)
+        await interaction.followup.send(f"✅ {membro.mention} agora está vinculado ao usuário do Notion `{notion_user_id}`.", ephemeral=True)
+    except NotionAPIError as e:
+        await interaction.followup.send(f"❌ Erro ao acessar o Notion: {e}", ephemeral=True)
+
+@link_notion_user.error
+async def link_notion_user_error(interaction: Interaction, error: app_commands.AppCommandError):
+    if isinstance(error, app_commands.MissingPermissions):
+        message = "❌ Você precisa ser um administrador para usar este comando."
+    else:
+        message = f"🔴 Um erro de comando ocorreu: {error}"
+        logging.error(f"Erro no comando /vincular_notion: {error}", exc_info=True)
+
+    if interaction.response.is_done():
+        await interaction.followup.send(message, ephemeral=True)
+    else:
+        await interaction.response.send_message(message, ephemeral=True)
+
+
+@bot.command(name="pergunta")
+async def pergunta(ctx: commands.Context, *, texto: str):
+    """Responde a uma pergunta com a IA, usando os cards da base do canal como contexto quando configurada."""
+    config = None
+    if ctx.guild:
+        config_channel_id = ctx.channel.parent_id if isinstance(ctx.channel, discord.Thread) else ctx.channel.id
+        config = load_config(ctx.guild.id, config_channel_id)
+    async with ctx.typing():
+        resposta = await ask(texto, guild_id=ctx.guild.id if ctx.guild else None, notion=notion, config=config)
+    await ctx.reply(resposta[:2000], mention_author=False)
+
+
 # --- INICIAR O BOT ---
 if __name__ == "__main__":
     if DISCORD_TOKEN:
@@ -1,38 +1,175 @@
 # config_utils.py
 
+import atexit
+import copy
 import json
-from typing import Optional, Dict, Any
+import logging
+import os
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Optional, Dict, Any, List, Tuple
+
+from notion_cache import extract_database_id
 
 CONFIG_FILE_PATH = 'configs.json'
 
-def save_config(server_id: str, channel_id: str, new_channel_config: Dict[str, Any]):
-    """Salva a configuração de um canal específico no arquivo JSON."""
-    try:
-        with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-            configs = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        configs = {}
 
-    server_id_str = str(server_id)
-    channel_id_str = str(channel_id)
+class JsonFileStore:
+    """
+    Base para arquivos JSON mantidos em memória e gravados no disco em lote,
+    de forma atômica (arquivo temporário + rename).
+    """
+    def __init__(self, path: str, flush_delay: float = 1.0):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._data: Optional[Dict[str, Any]] = None
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._dirty = False
+        atexit.register(self.flush)
+
+    def _load(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._data is None:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._data = json.load(f)
+                except FileNotFoundError:
+                    self._data = {}
+                except json.JSONDecodeError as e:
+                    logging.error(f"Erro ao ler {self.path}: {e}. Iniciando com dados vazios.")
+                    self._data = {}
+                self._on_load(self._data)
+            return self._data
+
+    def _on_load(self, data: Dict[str, Any]):
+        """Chamado uma vez, após a leitura do arquivo, para construir índices."""
+        pass
+
+    def _mark_dirty(self):
+        """Deve ser chamado com self._lock adquirido, após alterar self._data."""
+        self._dirty = True
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """Grava as alterações pendentes no disco de forma atômica."""
+        with self._write_lock:
+            with self._lock:
+                self._flush_timer = None
+                if not self._dirty:
+                    return
+                data = json.dumps(self._data, indent=4)
+                self._dirty = False
+            self._write(data)
+
+    def _write(self, data: str):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.store-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Erro ao salvar {self.path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            with self._lock:
+                self._mark_dirty()
+
+
+class ConfigStore(JsonFileStore):
+    """
+    Mantém as configurações de todos os servidores em memória (leituras O(1))
+    e grava no disco em lote. Cada canal tem seu próprio lock, para que
+    atualizações concorrentes do mesmo canal não se percam.
 
-    server_config = configs.get(server_id_str, {})
-    if 'channels' not in server_config:
-        server_config['channels'] = {}
+    Também mantém um índice reverso (ID da base de dados do Notion -> canais),
+    atualizado a cada gravação, usado para rotear os webhooks.
+    """
+    def __init__(self, path: str = CONFIG_FILE_PATH, flush_delay: float = 1.0):
+        super().__init__(path, flush_delay)
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = defaultdict(threading.Lock)
+        self._database_index: Dict[str, Dict[Tuple[str, str], None]] = defaultdict(dict)
+        self.version = 0 # Incrementado a cada alteração, para invalidar dados derivados
 
-    channel_config = server_config["channels"].get(channel_id_str, {})
-    channel_config.update(new_channel_config)
-    server_config["channels"][channel_id_str] = channel_config
-    configs[server_id_str] = server_config
+    def _on_load(self, data: Dict[str, Any]):
+        for server_id, server_config in data.items():
+            for channel_id, channel_config in server_config.get("channels", {}).items():
+                self._index_channel(server_id, channel_id, None, channel_config)
 
-    with open(CONFIG_FILE_PATH, 'w', encoding='utf-8') as f:
-        json.dump(configs, f, indent=4)
+    def _index_channel(self, server_id: str, channel_id: str,
+                       old_config: Optional[Dict[str, Any]], new_config: Dict[str, Any]):
+        """Atualiza o índice reverso quando a URL do Notion de um canal muda."""
+        old_db_id = extract_database_id((old_config or {}).get('notion_url'))
+        new_db_id = extract_database_id(new_config.get('notion_url'))
+        key = (server_id, channel_id)
+        if old_db_id and old_db_id != new_db_id:
+            self._database_index[old_db_id].pop(key, None)
+            if not self._database_index[old_db_id]:
+                del self._database_index[old_db_id]
+        if new_db_id:
+            self._database_index[new_db_id][key] = None
+
+    def database_ids(self) -> List[str]:
+        """IDs de todas as bases de dados do Notion configuradas em algum canal."""
+        self._load()
+        with self._lock:
+            return list(self._database_index)
+
+    def get_for_database(self, database_id: str) -> List[Dict[str, Any]]:
+        """
+        Retorna cópias das configurações de todos os canais ligados a uma base de dados,
+        com 'guild_id' e 'channel_id' preenchidos.
+        """
+        configs = self._load()
+        database_id = extract_database_id(database_id)
+        results = []
+        with self._lock:
+            for server_id, channel_id in list(self._database_index.get(database_id, {})):
+                channel_config = configs[server_id]["channels"][channel_id]
+                results.append({**copy.deepcopy(channel_config), 'guild_id': server_id, 'channel_id': channel_id})
+        return results
+
+    def get(self, server_id: str, channel_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna uma cópia da configuração do canal, ou None se não existir."""
+        channel_config = self._load().get(str(server_id), {}).get("channels", {}).get(str(channel_id))
+        return copy.deepcopy(channel_config) if channel_config is not None else None
+
+    def update(self, server_id: str, channel_id: str, new_channel_config: Dict[str, Any]):
+        """Mescla os campos informados na configuração do canal e agenda a gravação em disco."""
+        server_id_str, channel_id_str = str(server_id), str(channel_id)
+        configs = self._load()
+        with self._key_locks[(server_id_str, channel_id_str)]:
+            # Os dicionários de canal nunca são alterados no lugar: uma nova versão
+            # substitui a anterior, e a gravação sempre vê um estado consistente.
+            with self._lock:
+                server_config = configs.setdefault(server_id_str, {})
+                channels = server_config.setdefault("channels", {})
+                channel_config = dict(channels.get(channel_id_str, {}))
+            channel_config.update(copy.deepcopy(new_channel_config))
+            with self._lock:
+                self._index_channel(server_id_str, channel_id_str, channels.get(channel_id_str), channel_config)
+                channels[channel_id_str] = channel_config
+                self.version += 1
+                self._mark_dirty()
+
+
+config_store = ConfigStore()
+
+
+def save_config(server_id: str, channel_id: str, new_channel_config: Dict[str, Any]):
+    """Salva a configuração de um canal específico (gravação em lote no arquivo JSON)."""
+    config_store.update(server_id, channel_id, new_channel_config)
 
 def load_config(server_id: str, channel_id: str) -> Optional[Dict[str, Any]]:
-    """Carrega a configuração de um canal específico do arquivo JSON."""
-    try:
-        with open(CONFIG_FILE_PATH, 'r', encoding='utf-8') as f:
-            configs = json.load(f)
-        return configs.get(str(server_id), {}).get("channels", {}).get(str(channel_id))
-    except FileNotFoundError:
-        return None
\ No newline at end of file
+    """Carrega a configuração de um canal específico a partir da memória."""
+    return config_store.get(server_id, channel_id)
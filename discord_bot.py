@@ -1,12 +1,10 @@
 import discord
 from discord.ext import commands
-from ia_processor import IAProcessor
+from question_answering import ask
 from config import DISCORD_TOKEN
 
 class DiscordBot:
     def __init__(self):
-        self.ia = IAProcessor()
-
         intents = discord.Intents.default()
         intents.message_content = True  # Habilita o conteúdo da mensagem
         self.bot = commands.Bot(command_prefix="!", intents=intents)
@@ -33,8 +31,9 @@ class DiscordBot:
 
         @self.bot.command()
         async def pergunta(ctx, *, texto):
-            resposta = self.ia.gerar_resposta(texto)
-            await ctx.send(resposta)
+            async with ctx.typing():
+                resposta = await ask(texto, guild_id=ctx.guild.id if ctx.guild else None)
+            await ctx.send(resposta[:2000])
 
     def run(self):
         self.bot.run(DISCORD_TOKEN)
@@ -1,10 +1,17 @@
 # ia_processor.py
 
 import os
+import asyncio
+import contextvars
+import random
+from collections import OrderedDict, deque
 import google.generativeai as genai
-from typing import List
+from google.api_core import exceptions as google_exceptions
+from typing import List, Optional, Any, AsyncIterator, Tuple
 import discord
 
+from summary_cache import summary_cache
+
 # Configura a API do Google com a chave do ambiente
 try:
     genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
@@ -12,31 +19,107 @@ except TypeError:
     print("AVISO: Chave da API do Google não encontrada. A funcionalidade de IA estará desativada.")
     genai = None
 
-def _format_conversation(messages: List[discord.Message]) -> str:
-    """Formata uma lista de mensagens do Discord em um texto único e legível."""
-    conversation_text = ""
-    for msg in reversed(messages): # As mensagens vêm da mais nova para a mais antiga
-        if not msg.author.bot: # Ignora mensagens de bots
-            conversation_text += f"{msg.author.display_name}: {msg.clean_content}\n"
-    return conversation_text
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash-latest")
+GEMINI_MAX_CONCURRENT = int(os.getenv("GEMINI_MAX_CONCURRENT", "4"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+GEMINI_MAX_RETRIES = 2
 
-async def summarize_thread_content(messages: List[discord.Message]) -> str:
+# Modelo de IA configurado para ser eficiente e de alta qualidade (uma instância para o processo todo)
+_model = genai.GenerativeModel(GEMINI_MODEL_NAME) if genai else None
+
+# Servidor (guild) em nome do qual as chamadas ao modelo da tarefa atual são feitas
+current_guild: contextvars.ContextVar[Any] = contextvars.ContextVar('ia_current_guild', default=None)
+
+
+class FairLimiter:
     """
-    Usa a API do Gemini para resumir uma conversa de um tópico do Discord.
+    Limita quantas chamadas ao modelo rodam ao mesmo tempo. Quando todas as vagas
+    estão ocupadas, os pedidos esperam em uma fila por servidor e as vagas liberadas
+    são distribuídas em rodízio entre os servidores: uma rajada de /card em um
+    servidor movimentado não impede os demais de serem atendidos.
     """
-    if not genai:
-        return "Erro: A funcionalidade de IA não está configurada (API Key ausente)."
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self._queues: OrderedDict[Any, deque] = OrderedDict()
+
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def acquire(self, guild_id: Any):
+        if self.active < self.max_concurrent and not self._queues:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(guild_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # A vaga já tinha sido concedida: repassa para o próximo
+            raise
+
+    def release(self):
+        self.active -= 1
+        while self._queues and self.active < self.max_concurrent:
+            guild_id, queue = self._queues.popitem(last=False)
+            future = queue.popleft()
+            if queue:
+                self._queues[guild_id] = queue # Volta para o fim do rodízio
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire(current_guild.get())
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+gemini_limiter = FairLimiter(GEMINI_MAX_CONCURRENT)
+
+# Orçamento de tokens por chamada ao modelo; transcrições maiores são resumidas em partes (map-reduce)
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "24000"))
+# Máximo de rodadas de redução: os resumos do modelo nem sempre encolhem o texto
+SUMMARY_MAX_REDUCE_ROUNDS = max(1, int(os.getenv("SUMMARY_MAX_REDUCE_ROUNDS", "3")))
+# Estimativa simples de tokens (sem chamada extra à API): ~4 caracteres por token
+CHARS_PER_TOKEN = 4
 
-    conversation = _format_conversation(messages)
-    if not conversation.strip():
-        return "" # Retorna vazio se não houver mensagens de usuários
+def _conversation_lines(messages: List[discord.Message]) -> List[str]:
+    """Uma linha por mensagem de usuário, em ordem cronológica."""
+    return [f"{msg.author.display_name}: {msg.clean_content}\n"
+            for msg in reversed(messages) # As mensagens vêm da mais nova para a mais antiga
+            if not msg.author.bot] # Ignora mensagens de bots
 
-    # Modelo de IA configurado para ser eficiente e de alta qualidade
-    model = genai.GenerativeModel('gemini-1.5-flash-latest')
+def _estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
 
+def _split_by_token_budget(lines: List[str], budget: Optional[int] = None) -> List[str]:
+    """Agrupa as linhas em trechos que cabem no orçamento de tokens (uma linha nunca é dividida)."""
+    budget = budget or SUMMARY_CHUNK_TOKENS
+    chunks, current, current_tokens = [], [], 0
+    for line in lines:
+        line_tokens = _estimate_tokens(line)
+        if current and current_tokens + line_tokens > budget:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+def _truncate_to_budget(texts: List[str], budget: Optional[int] = None) -> List[str]:
+    """Corta cada texto à sua fração do orçamento de tokens, para que todos caibam juntos em um prompt."""
+    budget = budget or SUMMARY_CHUNK_TOKENS
+    max_chars = budget * CHARS_PER_TOKEN // max(len(texts), 1)
+    return [text[:max_chars] for text in texts]
+
+def _summary_prompt(conversation: str) -> str:
     # O prompt é a instrução que damos para a IA. É a parte mais importante.
     # REVERTIDO PARA O PROMPT ORIGINAL
-    prompt = f"""
+    return f"""
     Você é um assistente especialista em resumir discussões de equipes.
     Sua tarefa é ler a transcrição de uma conversa de um tópico do Discord e criar um resumo conciso e informativo em português.
 
@@ -55,9 +138,209 @@ async def summarize_thread_content(messages: List[discord.Message]) -> str:
     Por favor, gere o resumo.
     """
 
+def _partial_prompt(chunk: str, index: int, total: int) -> str:
+    return f"""
+    Você está resumindo uma conversa longa de um tópico do Discord, dividida em {total} partes.
+    Esta é a parte {index} de {total}. Resuma em português apenas esta parte, mantendo
+    os pontos principais, as decisões tomadas, as ações sugeridas e os links compartilhados.
+    Não escreva introdução nem conclusão: o texto será combinado com o das outras partes.
+
+    ---
+    {chunk}
+    ---
+    """
+
+def _merge_prompt(partial_summaries: List[str]) -> str:
+    parts = "\n\n".join(f"Parte {i}:\n{summary}" for i, summary in enumerate(partial_summaries, start=1))
+    return _summary_prompt(
+        "A conversa era longa e foi resumida em partes, em ordem cronológica. "
+        "Combine os resumos parciais abaixo em um único resumo, sem repetições.\n\n" + parts)
+
+def _update_prompt(previous_summary: str, new_material: str) -> str:
+    return f"""
+    Você mantém o resumo de uma conversa de um tópico do Discord, em português.
+    Abaixo estão o resumo atual e as mensagens enviadas depois dele. Reescreva o resumo
+    incorporando as novidades (novos pontos, decisões, ações e links), no mesmo formato,
+    e mantendo o que continua válido.
+
+    Resumo atual:
+    ---
+    {previous_summary}
+    ---
+
+    Novas mensagens:
+    ---
+    {new_material}
+    ---
+    """
+
+async def _generate(prompt: str) -> str:
+    """Chama o modelo respeitando o limite de concorrência, com timeout e novas tentativas se a cota estourar."""
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        try:
+            async with gemini_limiter:
+                response = await asyncio.wait_for(_model.generate_content_async(prompt), timeout=GEMINI_TIMEOUT)
+            return response.text
+        except (google_exceptions.ResourceExhausted, google_exceptions.ServiceUnavailable):
+            if attempt == GEMINI_MAX_RETRIES:
+                raise
+            await asyncio.sleep(random.uniform(1, 2 ** (attempt + 2)))
+
+async def _summarize_chunks(chunks: List[str]) -> List[str]:
+    """Resume cada trecho em paralelo (etapa "map")."""
+    return await asyncio.gather(*[
+        _generate(_partial_prompt(chunk, i, len(chunks))) for i, chunk in enumerate(chunks, start=1)])
+
+async def _condense(lines: List[str]) -> str:
+    """
+    Reduz as linhas a um texto que cabe no orçamento: a própria transcrição, se couber;
+    senão, os resumos parciais de cada trecho (gerados em paralelo), reduzidos de novo
+    enquanto ainda não couberem, por no máximo SUMMARY_MAX_REDUCE_ROUNDS rodadas.
+    Se ainda assim não couberem, os resumos parciais são cortados ao orçamento.
+    """
+    chunks = _split_by_token_budget(lines)
+    if len(chunks) <= 1:
+        return _summary_prompt(chunks[0] if chunks else "")
+    for _ in range(SUMMARY_MAX_REDUCE_ROUNDS):
+        partials = await _summarize_chunks(chunks)
+        chunks = _split_by_token_budget([f"{summary}\n\n" for summary in partials])
+        if len(chunks) == 1:
+            return _merge_prompt(list(partials))
+    return _merge_prompt(_truncate_to_budget(list(partials)))
+
+async def _update_prompt_for(previous_summary: str, new_lines: List[str]) -> str:
+    """Prompt que incorpora apenas as mensagens novas ao resumo anterior."""
+    chunks = _split_by_token_budget(new_lines)
+    if len(chunks) <= 1:
+        new_material = chunks[0] if chunks else ""
+    else:
+        new_material = "\n\n".join(await _summarize_chunks(chunks))
+    return _update_prompt(previous_summary, new_material)
+
+async def _plan_summary(messages: List[discord.Message], lines: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Retorna (resumo pronto, prompt final): o resumo vem do cache quando a transcrição
+    não mudou; senão, o prompt incorpora só as mensagens novas ao resumo anterior ou,
+    sem resumo anterior, resume a transcrição inteira (por map-reduce, se for longa).
+    """
+    thread_id = messages[0].channel.id
+    cached_summary = summary_cache.get(thread_id, "".join(lines))
+    if cached_summary is not None:
+        return cached_summary, None
+    previous = summary_cache.get_entry(thread_id)
+    message_ids = [msg.id for msg in messages]
+    if previous and previous.get("last_message_id") in message_ids:
+        # Resumo incremental: apenas as mensagens posteriores ao último resumo
+        new_lines = _conversation_lines(messages[:message_ids.index(previous["last_message_id"])])
+        if not new_lines:
+            return previous["summary"], None
+        return None, await _update_prompt_for(previous["summary"], new_lines)
+    return None, await _condense(lines)
+
+def _prepare(messages: List[discord.Message]) -> Tuple[List[str], Optional[str]]:
+    """Linhas da conversa e, se não houver o que resumir, o texto a devolver direto."""
+    if not genai:
+        return [], "Erro: A funcionalidade de IA não está configurada (API Key ausente)."
+    lines = _conversation_lines(messages)
+    if not "".join(lines).strip():
+        return [], "" # Retorna vazio se não houver mensagens de usuários
+    if messages[0].guild:
+        current_guild.set(messages[0].guild.id)
+    return lines, None
+
+async def summarize_thread_content(messages: List[discord.Message]) -> str:
+    """
+    Usa a API do Gemini para resumir uma conversa de um tópico do Discord.
+    Resumos de tópicos sem mensagens novas vêm do cache, sem chamar o modelo; se há
+    mensagens novas, só elas são incorporadas ao resumo anterior. Conversas maiores
+    que o orçamento de tokens são resumidas em partes, em paralelo, e depois combinadas.
+    """
+    lines, early_result = _prepare(messages)
+    if early_result is not None:
+        return early_result
+    try:
+        summary, prompt = await _plan_summary(messages, lines)
+        if summary is None:
+            summary = await _generate(prompt)
+        summary_cache.set(messages[0].channel.id, "".join(lines), summary, last_message_id=messages[0].id)
+        return summary
+    except Exception as e:
+        print(f"Erro ao chamar a API do Gemini: {e!r}")
+        return f"Erro ao gerar o resumo: {e!r}"
+
+async def _stream_into(prompt: str, queue: asyncio.Queue):
+    """Coloca na fila os pedaços do streaming do modelo; ao final, None (ou a exceção, se falhar)."""
+    try:
+        async with gemini_limiter:
+            response = await asyncio.wait_for(_model.generate_content_async(prompt, stream=True), timeout=GEMINI_TIMEOUT)
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=GEMINI_TIMEOUT)
+                except StopAsyncIteration:
+                    break
+                queue.put_nowait(chunk.text)
+    except Exception as e:
+        queue.put_nowait(e)
+    else:
+        queue.put_nowait(None)
+
+async def stream_thread_summary(messages: List[discord.Message]) -> AsyncIterator[str]:
+    """
+    Versão em streaming de summarize_thread_content: produz o resumo em pedaços de texto
+    à medida que o modelo os gera (um único pedaço quando vem do cache). Erros são
+    propagados ao consumidor, que decide o que fazer com o texto já recebido.
+    """
+    lines, early_result = _prepare(messages)
+    if early_result is not None:
+        if early_result.startswith("Erro:"):
+            raise RuntimeError(early_result)
+        return
+    summary, prompt = await _plan_summary(messages, lines)
+    if summary is not None:
+        yield summary
+        return
+    # O modelo é lido em uma tarefa à parte: a vaga do limitador fica ocupada só enquanto
+    # o modelo gera, e não enquanto o consumidor (mais lento) grava cada pedaço no Notion
+    queue: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.ensure_future(_stream_into(prompt, queue))
+    parts = []
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            parts.append(item)
+            yield item
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+    summary_cache.set(messages[0].channel.id, "".join(lines), "".join(parts), last_message_id=messages[0].id)
+
+def _question_prompt(question: str, context: str) -> str:
+    context_section = f"""
+    Use os cards do Notion abaixo como fonte principal. Se eles não responderem
+    à pergunta, diga isso e responda com o seu conhecimento geral.
+
+    Cards do Notion:
+    ---
+    {context}
+    ---
+    """ if context else ""
+    return f"""
+    Você é um assistente de uma equipe que usa o Discord e o Notion. Responda em português,
+    de forma direta e em no máximo alguns parágrafos.
+    {context_section}
+    Pergunta: {question}
+    """
+
+async def answer_question(question: str, context: str = "", guild_id: Any = None) -> str:
+    """Responde a uma pergunta livre (opcionalmente com trechos do Notion como contexto) no modelo compartilhado."""
+    if not genai:
+        return "Erro: A funcionalidade de IA não está configurada (API Key ausente)."
+    if guild_id is not None:
+        current_guild.set(guild_id)
     try:
-        response = await model.generate_content_async(prompt)
-        return response.text
+        return await _generate(_question_prompt(question, context))
     except Exception as e:
-        print(f"Erro ao chamar a API do Gemini: {e}")
-        return f"Erro ao gerar o resumo: {e}"
\ No newline at end of file
+        print(f"Erro ao chamar a API do Gemini: {e!r}")
+        return f"Erro ao gerar a resposta: {e!r}"
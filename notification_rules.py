@@ -0,0 +1,87 @@
+# notification_rules.py
+
+from typing import List, Dict, Any, Optional, Tuple
+
+from config_utils import config_store
+
+
+class _KeepMissing(dict):
+    """Mantém no texto os placeholders desconhecidos, em vez de gerar erro."""
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def render_template(template: str, card_title: str, trigger_value: str) -> str:
+    """Preenche {card_title} e {trigger_value} no template da mensagem da regra."""
+    values = _KeepMissing(card_title=card_title, trigger_value=trigger_value)
+    try:
+        return template.format_map(values)
+    except (ValueError, IndexError):
+        # Chaves soltas no template: substitui apenas os placeholders conhecidos
+        return template.replace("{card_title}", card_title).replace("{trigger_value}", trigger_value)
+
+
+def _normalize_value(value: str) -> str:
+    return " ".join(str(value).casefold().split())
+
+
+class RuleEngine:
+    """
+    Regras de notificação (notification_rules) de todos os canais, compiladas em um
+    índice database -> propriedade gatilho -> valor -> regras. Assim, cada evento é
+    comparado apenas com as regras que de fato correspondem ao valor atual do card.
+    O índice é reconstruído somente quando alguma configuração é alterada.
+    """
+    def __init__(self, store=config_store):
+        self.store = store
+        self._index: Dict[str, Dict[str, Dict[str, List[Tuple[dict, dict]]]]] = {}
+        self._version: Optional[int] = None
+
+    def _ensure_compiled(self):
+        if self._version == self.store.version:
+            return
+        index = {}
+        for database_id in self.store.database_ids():
+            for config in self.store.get_for_database(database_id):
+                for rule in config.get('notification_rules', []):
+                    prop_name, value = rule.get('trigger_property_name'), rule.get('trigger_value_name')
+                    if not prop_name or value is None:
+                        continue
+                    by_value = index.setdefault(database_id, {}).setdefault(prop_name, {})
+                    by_value.setdefault(_normalize_value(value), []).append((rule, config))
+        self._index = index
+        self._version = self.store.version
+
+    def trigger_properties(self, database_id: str) -> List[str]:
+        """Nomes das propriedades observadas por alguma regra desta base."""
+        self._ensure_compiled()
+        return list(self._index.get(database_id, {}))
+
+    def watched_values(self, database_id: str, page: Dict[str, Any], notion) -> Dict[str, List[str]]:
+        """Valores atuais (um por opção, no caso de multi_select) das propriedades observadas."""
+        self._ensure_compiled()
+        values = {}
+        properties = page.get('properties', {})
+        for prop_name in self._index.get(database_id, {}):
+            prop_data = properties.get(prop_name)
+            if not prop_data:
+                continue
+            prop_type = prop_data.get('type')
+            if prop_type == 'multi_select':
+                values[prop_name] = [tag.get('name', '') for tag in prop_data.get('multi_select', [])]
+            else:
+                value = notion.extract_value_from_property(prop_data, prop_type)
+                values[prop_name] = [value] if value else []
+        return values
+
+    def match_values(self, database_id: str, values: Dict[str, List[str]]) -> List[Tuple[dict, dict, str]]:
+        """Retorna (regra, config do canal, valor do gatilho) para cada regra satisfeita pelos valores."""
+        self._ensure_compiled()
+        matches = []
+        rules_by_prop = self._index.get(database_id, {})
+        for prop_name, prop_values in values.items():
+            by_value = rules_by_prop.get(prop_name, {})
+            for value in prop_values:
+                for rule, config in by_value.get(_normalize_value(value), []):
+                    matches.append((rule, config, value))
+        return matches
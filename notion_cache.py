@@ -0,0 +1,169 @@
+# notion_cache.py
+
+import re
+import time
+import unicodedata
+from typing import Optional, Dict, Any, List, Tuple
+
+
+def extract_database_id(value: Optional[str]) -> Optional[str]:
+    """Extrai o ID de 32 caracteres de uma URL do Notion ou de um ID com hífens (formato UUID)."""
+    if not value: return None
+    match = re.search(r"([a-f0-9]{32})", value)
+    if match: return match.group(1)
+    match = re.search(r"([a-f0-9]{8})-([a-f0-9]{4})-([a-f0-9]{4})-([a-f0-9]{4})-([a-f0-9]{12})", value)
+    if match: return "".join(match.groups())
+    return None
+
+
+class SchemaCache:
+    """
+    Cache em memória das propriedades (schema) de cada base de dados do Notion,
+    com tempo de expiração (TTL). As chaves são os IDs retornados por extract_database_id.
+    """
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, database_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(database_id)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+        if entry:
+            del self._entries[database_id]
+        self.misses += 1
+        return None
+
+    def set(self, database_id: str, properties: Dict[str, Any]):
+        self._entries[database_id] = (time.monotonic(), properties)
+
+    def invalidate(self, database_id: Optional[str] = None):
+        """Remove o schema de uma base de dados, ou de todas se nenhum ID for informado."""
+        if database_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(database_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def normalize_name(name: str) -> str:
+    """Normaliza um nome para comparação: sem acentos, minúsculo e com espaços simples."""
+    decomposed = unicodedata.normalize('NFKD', name)
+    without_accents = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(without_accents.casefold().split())
+
+
+class UserDirectory:
+    """
+    Diretório em memória dos usuários do Notion, com índices por e-mail (exato),
+    por nome normalizado e por prefixo das palavras do nome. A lista completa é
+    recarregada (com paginação) quando fica mais velha que refresh_interval.
+    """
+    def __init__(self, refresh_interval: float = 600.0):
+        self.refresh_interval = refresh_interval
+        self.loaded_at: Optional[float] = None
+        self._users: List[Dict[str, Any]] = []
+        self._names: List[str] = []
+        self._by_email: Dict[str, str] = {}
+        self._by_name: Dict[str, str] = {}
+        self._by_prefix: Dict[str, set] = {}
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at >= self.refresh_interval
+
+    def load(self, users: List[Dict[str, Any]]):
+        """Substitui o conteúdo do diretório e reconstrói os índices."""
+        by_email, by_name, by_prefix, names = {}, {}, {}, []
+        for position, user in enumerate(users):
+            name = normalize_name(user.get("name") or "")
+            names.append(name)
+            email = (user.get("person") or {}).get("email")
+            if email:
+                by_email.setdefault(email.casefold(), user["id"])
+            if name:
+                by_name.setdefault(name, user["id"])
+                for token in set(name.split()):
+                    for end in range(1, len(token) + 1):
+                        by_prefix.setdefault(token[:end], set()).add(position)
+        self._users, self._names = users, names
+        self._by_email, self._by_name, self._by_prefix = by_email, by_name, by_prefix
+        self.loaded_at = time.monotonic()
+
+    def lookup_exact(self, search_term: str) -> Optional[str]:
+        """Procura o ID de um usuário apenas por e-mail exato ou nome normalizado exato."""
+        if not search_term:
+            return None
+        if user_id := self._by_email.get(search_term.strip().casefold()):
+            return user_id
+        return self._by_name.get(normalize_name(search_term)) or None
+
+    def lookup(self, search_term: str) -> Optional[str]:
+        """
+        Procura o ID de um usuário por e-mail exato, nome exato, prefixo das palavras
+        do nome e, por fim, por trecho do nome. Retorna None se não encontrar.
+        """
+        if user_id := self.lookup_exact(search_term):
+            return user_id
+        term = normalize_name(search_term or "")
+        if not term:
+            return None
+
+        candidates = None
+        for token in term.split():
+            positions = self._by_prefix.get(token, set())
+            candidates = positions if candidates is None else candidates & positions
+            if not candidates:
+                break
+        if candidates:
+            return self._users[min(candidates)]["id"]
+
+        for position, name in enumerate(self._names):
+            if term in name:
+                return self._users[position]["id"]
+        return None
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+class DatabaseCountCache:
+    """
+    Total de cards por base de dados. Depois da primeira contagem completa,
+    o valor é mantido por eventos de criação/arquivamento recebidos via webhook.
+    Como um evento pode não chegar (webhook não configurado ou entrega perdida),
+    cada contagem expira após o TTL e a próxima consulta conta a base de novo.
+    """
+    def __init__(self, ttl: float = 3600.0):
+        self.ttl = ttl
+        self._counts: Dict[str, Tuple[float, int]] = {}
+
+    def get(self, database_id: str) -> Optional[int]:
+        entry = self._counts.get(database_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.ttl:
+            del self._counts[database_id]
+            return None
+        return entry[1]
+
+    def set(self, database_id: str, count: int):
+        self._counts[database_id] = (time.monotonic(), count)
+
+    def adjust(self, database_id: str, delta: int):
+        """Ajusta a contagem de uma base já contada (sem renovar o TTL); bases nunca contadas são ignoradas."""
+        if entry := self._counts.get(database_id):
+            self._counts[database_id] = (entry[0], max(0, entry[1] + delta))
+
+    def invalidate(self, database_id: str):
+        self._counts.pop(database_id, None)
@@ -1,30 +1,66 @@
 # notion_integration.py (Versão com correção da busca por 'people' e formatação de IA com parser Markdown)
 
-from notion_client import Client
+import httpx
 import os
 from dotenv import load_dotenv
 import re
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import Callable, List, Optional, Dict, Any
 import discord
 
+import asyncio
+import logging
+import time
+
+from notion_cache import SchemaCache, UserDirectory, DatabaseCountCache, extract_database_id
+from notion_scheduler import NotionRequestScheduler, ScheduledAsyncClient
+from notion_mirror import MIRROR_CURSOR_PREFIX
+
 load_dotenv()
 
+# Limites da API do Notion por requisição
+MAX_BLOCKS_PER_REQUEST = 100
+MAX_RICH_TEXT_LENGTH = 2000
+
+# Intervalo mínimo (segundos) entre as atualizações de progresso da contagem de cards
+COUNT_PROGRESS_INTERVAL = float(os.getenv("NOTION_COUNT_PROGRESS_INTERVAL", "2"))
+
+def split_rich_text(rich_text: List[Dict]) -> List[Dict]:
+    """Divide objetos rich_text com mais de 2000 caracteres, preservando formatação e link."""
+    result = []
+    for item in rich_text:
+        content = item.get('text', {}).get('content', '')
+        if len(content) <= MAX_RICH_TEXT_LENGTH:
+            result.append(item)
+            continue
+        for start in range(0, len(content), MAX_RICH_TEXT_LENGTH):
+            result.append({**item, 'text': {**item['text'], 'content': content[start:start + MAX_RICH_TEXT_LENGTH]}})
+    return result
+
+def split_long_text_blocks(blocks: List[Dict]) -> List[Dict]:
+    """Aplica split_rich_text ao rich_text de cada bloco (ex.: parágrafos longos do resumo)."""
+    result = []
+    for block in blocks:
+        block_type = block.get('type')
+        content = block.get(block_type)
+        if isinstance(content, dict) and 'rich_text' in content:
+            block = {**block, block_type: {**content, 'rich_text': split_rich_text(content['rich_text'])}}
+        result.append(block)
+    return result
+
 class NotionAPIError(Exception):
     """Exceção customizada para erros da API do Notion."""
     pass
 
-class NotionIntegration:
-    def __init__(self):
-        self.token = os.getenv("NOTION_TOKEN")
-        if not self.token:
-            raise ValueError("O token do Notion (NOTION_TOKEN) não foi encontrado no seu ambiente.")
-        self.notion = Client(auth=self.token)
-
+class NotionFormatting:
+    """
+    Conversões entre os valores do bot e o formato da API do Notion (propriedades,
+    blocos e embeds), sem I/O. As chamadas à API ficam na AsyncNotionIntegration.
+    """
     def _format_property_value(self, prop_type: str, prop_value):
         """Função auxiliar para formatar um valor para a API do Notion."""
-        if prop_type == 'title': return {"title": [{"text": {"content": str(prop_value)}}]}
-        elif prop_type == 'rich_text': return {"rich_text": [{"text": {"content": str(prop_value)}}]}
+        if prop_type == 'title': return {"title": split_rich_text([{"text": {"content": str(prop_value)}}])}
+        elif prop_type == 'rich_text': return {"rich_text": split_rich_text([{"text": {"content": str(prop_value)}}])}
         elif prop_type == 'url': return {"url": prop_value}
         elif prop_type == 'status': return {"status": {"name": str(prop_value)}}
         elif prop_type == 'select':
@@ -46,13 +82,6 @@ class NotionIntegration:
             else:
                 print(f"Aviso: Não foi possível interpretar a data '{prop_value}'.")
                 return None
-        elif prop_type == 'people':
-            if isinstance(prop_value, list):
-                return {"people": [{"id": user_id} for user_id in prop_value]}
-            try:
-                user_id = self.search_id_person(str(prop_value))
-                if user_id: return {"people": [{"id": user_id}]}
-            except NotionAPIError as e: print(f"Aviso: {e}. Propriedade 'people' será ignorada.")
         return None
 
     def _convert_text_to_notion_rich_text_objects(self, text_content: str):
@@ -134,105 +163,7 @@ class NotionIntegration:
         return notion_blocks
 
     def extract_database_id(self, url):
-        match = re.search(r"([a-f0-9]{32})", url)
-        if match: return match.group(1)
-        return None
-
-    def search_in_database(self, url, search_term, filter_property, property_type="rich_text"):
-        database_id = self.extract_database_id(url)
-        if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
-        filter_criteria = {"property": filter_property}
-
-        if property_type in ["rich_text", "title"]:
-            filter_criteria[property_type] = {"contains": search_term}
-        elif property_type in ["status", "select"]:
-            filter_criteria[property_type] = {"equals": search_term}
-        elif property_type == "people":
-            pessoa_id = self.search_id_person(search_term)
-            if pessoa_id:
-                filter_criteria["people"] = {"contains": pessoa_id}
-            else:
-                return {"results": []} # Se não encontrar a pessoa, retorna uma busca vazia para não dar erro
-        try:
-            return self.notion.databases.query(database_id=database_id, filter=filter_criteria)
-        except Exception as e:
-            raise NotionAPIError(f"Erro ao buscar no Notion: {e}")
-
-    def get_database_properties(self, url):
-        database_id = self.extract_database_id(url)
-        if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
-        try:
-            return self.notion.databases.retrieve(database_id)['properties']
-        except Exception as e: raise NotionAPIError(f"Erro ao obter propriedades do Notion: {e}")
-
-    def search_id_person(self, search_term: str):
-        if not isinstance(search_term, str) or not search_term:
-            return None
-        try:
-            users = self.notion.users.list()
-            search_term_lower = search_term.lower()
-            for user in users.get("results", []):
-                user_name = user.get("name")
-                if user_name and search_term_lower in user_name.lower():
-                    return user.get("id")
-                user_email = user.get("person", {}).get("email")
-                if user_email and user_email.lower() == search_term_lower:
-                    return user.get("id")
-            return None
-        except Exception as e:
-            print(f"Erro ao buscar usuários do Notion: {e}")
-            raise NotionAPIError(f"Não foi possível buscar os usuários no Notion.")
-
-    def get_database_count(self, url):
-        database_id = self.extract_database_id(url)
-        if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
-        try:
-            query_result = self.notion.databases.query(database_id)
-            return len(query_result['results'])
-        except Exception as e: raise NotionAPIError(f"Erro ao contar páginas no Notion: {e}")
-
-    def insert_into_database(self, url, properties, children: Optional[List[Dict]] = None):
-        """
-        Cria uma nova página no Notion, com propriedades e, opcionalmente, conteúdo (children).
-        """
-        database_id = self.extract_database_id(url)
-        if not database_id:
-            raise NotionAPIError("ID da base de dados não encontrado na URL.")
-
-        payload = {
-            "parent": {"database_id": database_id},
-            "properties": properties
-        }
-        if children:
-            payload["children"] = children
-
-        try:
-            return self.notion.pages.create(**payload)
-        except Exception as e:
-            raise NotionAPIError(f"Erro ao criar a página no Notion: {e}")
-
-    def build_page_properties(self, db_url: str, title: str, properties_dict: dict):
-        schema = self.get_database_properties(db_url)
-        page_properties = {}
-        title_prop_name = next((name for name, data in schema.items() if data['type'] == 'title'), None)
-        if title_prop_name:
-            page_properties[title_prop_name] = self._format_property_value('title', title)
-
-        for prop_name, prop_value in properties_dict.items():
-            prop_data = schema.get(prop_name)
-            if not prop_data:
-                print(f"AVISO: A propriedade '{prop_name}' não foi encontrada na base de dados. Ela será ignorada.")
-                continue
-            formatted_prop = self._format_property_value(prop_data.get('type'), prop_value)
-            if formatted_prop:
-                page_properties[prop_name] = formatted_prop
-        return page_properties
-
-    def build_update_payload(self, prop_name: str, prop_type: str, prop_value):
-        formatted_prop = self._format_property_value(prop_type, prop_value)
-        if formatted_prop:
-            return {prop_name: formatted_prop}
-        return {}
+        return extract_database_id(url)
 
     def extract_value_from_property(self, prop_data, prop_type):
         try:
@@ -254,8 +185,7 @@ class NotionIntegration:
             return ''
 
 
-    def get_properties_for_interaction(self, url):
-        all_props = self.get_database_properties(url)
+    def _properties_for_interaction(self, all_props: dict):
         properties_to_ask, title_prop = [], None
         excluded_types = ['rollup', 'created_by', 'created_time', 'last_edited_by', 'last_edited_time', 'formula']
         for prop_name, prop_data in all_props.items():
@@ -301,19 +231,447 @@ class NotionIntegration:
 
         return embed
 
-    def update_page(self, page_id: str, properties: dict):
+class AsyncNotionIntegration(NotionFormatting):
+    """
+    Integração com o Notion. Usa o AsyncClient do Notion sobre uma sessão HTTP
+    compartilhada (pool de conexões keep-alive), para que as chamadas não bloqueiem
+    o event loop do Discord.
+    Todas as requisições passam pelo NotionRequestScheduler (limite de taxa e retentativas).
+    """
+    def __init__(self, max_connections: int = 20, people_mapping=None, mirror=None):
+        self.token = os.getenv("NOTION_TOKEN")
+        if not self.token:
+            raise ValueError("O token do Notion (NOTION_TOKEN) não foi encontrado no seu ambiente.")
+        self.http_session = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+        self.scheduler = NotionRequestScheduler(rate=float(os.getenv("NOTION_REQUESTS_PER_SECOND", "3")))
+        self.notion = ScheduledAsyncClient(self.scheduler, auth=self.token, client=self.http_session)
+        self.schema_cache = SchemaCache(ttl=float(os.getenv("NOTION_SCHEMA_CACHE_TTL", "300")))
+        self.user_directory = UserDirectory(refresh_interval=float(os.getenv("NOTION_USERS_REFRESH_INTERVAL", "600")))
+        self._user_directory_lock = asyncio.Lock()
+        self.people_mapping = people_mapping # Mapeamento persistente Discord -> Notion (PeopleMappingStore)
+        self.count_cache = DatabaseCountCache(ttl=float(os.getenv("NOTION_COUNT_CACHE_TTL", "3600")))
+        self.mirror = mirror # Espelho local opcional para buscas (NotionMirror)
+        self._count_tasks: Dict[str, asyncio.Task] = {}
+
+    async def aclose(self):
+        """Fecha a sessão HTTP compartilhada."""
+        await self.http_session.aclose()
+
+    async def _format_property_value(self, prop_type: str, prop_value):
+        if prop_type == 'people' and isinstance(prop_value, list):
+            user_ids = []
+            for item in prop_value:
+                try:
+                    user_id = await self.resolve_member(item) if isinstance(item, discord.abc.User) else item
+                except NotionAPIError as e:
+                    print(f"Aviso: {e}. O membro {item} será ignorado na propriedade 'people'.")
+                    continue
+                if user_id and user_id not in user_ids: user_ids.append(user_id)
+            return {"people": [{"id": user_id} for user_id in user_ids]}
+        if prop_type == 'people' and isinstance(prop_value, discord.abc.User):
+            try:
+                user_id = await self.resolve_member(prop_value)
+                if user_id: return {"people": [{"id": user_id}]}
+            except NotionAPIError as e: print(f"Aviso: {e}. Propriedade 'people' será ignorada.")
+            return None
+        if prop_type == 'people':
+            try:
+                user_id = await self.search_id_person(str(prop_value))
+                if user_id: return {"people": [{"id": user_id}]}
+            except NotionAPIError as e: print(f"Aviso: {e}. Propriedade 'people' será ignorada.")
+            return None
+        return super()._format_property_value(prop_type, prop_value)
+
+    async def search_in_database(self, url, search_term, filter_property, property_type="rich_text",
+                                 start_cursor: Optional[str] = None, page_size: Optional[int] = None):
+        """Retorna uma página de resultados da busca (com 'has_more' e 'next_cursor' para continuar)."""
+        database_id = self.extract_database_id(url)
+        if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
+        filter_criteria = {"property": filter_property}
+
+        if property_type in ["rich_text", "title"]:
+            filter_criteria[property_type] = {"contains": search_term}
+        elif property_type in ["status", "select"]:
+            filter_criteria[property_type] = {"equals": search_term}
+        elif property_type == "people":
+            pessoa_id = await self.search_id_person(search_term)
+            if pessoa_id:
+                filter_criteria["people"] = {"contains": pessoa_id}
+            else:
+                return {"results": [], "has_more": False, "next_cursor": None}
+
+        # Bases com espelho local sincronizado são respondidas sem chamar a API (com a
+        # mesma paginação; os cursores do espelho continuam no espelho)
+        mirror_cursor = bool(start_cursor) and start_cursor.startswith(MIRROR_CURSOR_PREFIX)
+        if self.mirror and (mirror_cursor or (self.mirror.is_ready(database_id) and not start_cursor)):
+            search_value = filter_criteria["people"]["contains"] if property_type == "people" else search_term
+            return await self.mirror.search(database_id, filter_property, property_type, search_value,
+                                            page_size=page_size, start_cursor=start_cursor)
+
+        query_kwargs = {"database_id": database_id, "filter": filter_criteria}
+        if start_cursor: query_kwargs["start_cursor"] = start_cursor
+        if page_size: query_kwargs["page_size"] = page_size
+        try:
+            return await self.notion.databases.query(**query_kwargs)
+        except Exception as e:
+            raise NotionAPIError(f"Erro ao buscar no Notion: {e}")
+
+    async def iter_database_pages(self, url_or_id: str, query_filter: Optional[dict] = None, page_size: int = 100,
+                                  filter_properties: Optional[List[str]] = None):
+        """
+        Gerador assíncrono sobre todas as páginas de resultados de uma base (sem usar o espelho).
+        filter_properties limita as propriedades retornadas (ex.: ["title"] para listar só os IDs).
+        """
+        database_id = self.extract_database_id(url_or_id)
+        if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
+        cursor = None
+        while True:
+            query_kwargs = {"database_id": database_id, "page_size": page_size}
+            if query_filter: query_kwargs["filter"] = query_filter
+            if filter_properties is not None: query_kwargs["filter_properties"] = filter_properties
+            if cursor: query_kwargs["start_cursor"] = cursor
+            try:
+                response = await self.notion.databases.query(**query_kwargs)
+            except Exception as e:
+                raise NotionAPIError(f"Erro ao buscar no Notion: {e}")
+            yield response
+            if not response.get("has_more"): return
+            cursor = response.get("next_cursor")
+
+    async def iter_search_pages(self, url, search_term, filter_property, property_type="rich_text",
+                                page_size: int = 25):
+        """
+        Gerador assíncrono que percorre os resultados da busca seguindo start_cursor/has_more.
+        Cada item é uma resposta da API ('results', 'has_more'); a próxima página só é
+        buscada quando o consumidor pede o item seguinte.
+        """
+        cursor = None
+        while True:
+            response = await self.search_in_database(url, search_term, filter_property, property_type,
+                                                     start_cursor=cursor, page_size=page_size)
+            yield response
+            if not response.get("has_more"): return
+            cursor = response.get("next_cursor")
+
+    async def get_database_properties(self, url):
+        database_id = self.extract_database_id(url)
+        if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
+        cached = self.schema_cache.get(database_id)
+        if cached is not None:
+            return cached
+        try:
+            properties = (await self.notion.databases.retrieve(database_id))['properties']
+        except Exception as e: raise NotionAPIError(f"Erro ao obter propriedades do Notion: {e}")
+        self.schema_cache.set(database_id, properties)
+        return properties
+
+    def invalidate_schema(self, url_or_id: str):
+        """Descarta o schema em cache de uma base de dados (URL ou ID)."""
+        database_id = self.extract_database_id(url_or_id)
+        if database_id:
+            self.schema_cache.invalidate(database_id)
+
+    async def _ensure_user_directory(self):
+        """Recarrega (com paginação) o diretório de usuários do Notion se ele estiver desatualizado."""
+        if not self.user_directory.is_stale():
+            return
+        async with self._user_directory_lock:
+            if not self.user_directory.is_stale():
+                return
+            try:
+                users, cursor = [], None
+                while True:
+                    kwargs = {"page_size": 100}
+                    if cursor: kwargs["start_cursor"] = cursor
+                    response = await self.notion.users.list(**kwargs)
+                    users.extend(response.get("results", []))
+                    if not response.get("has_more"): break
+                    cursor = response.get("next_cursor")
+            except Exception as e:
+                print(f"Erro ao buscar usuários do Notion: {e}")
+                if self.user_directory.loaded_at is None:
+                    raise NotionAPIError(f"Não foi possível buscar os usuários no Notion.")
+                return # Mantém o diretório anterior até a próxima tentativa
+            self.user_directory.load(users)
+
+    async def search_id_person(self, search_term: str):
+        if not isinstance(search_term, str) or not search_term:
+            return None
+        await self._ensure_user_directory()
+        return self.user_directory.lookup(search_term)
+
+    def _match_member(self, member: discord.abc.User) -> Optional[str]:
+        """
+        Resolve um membro pelo mapeamento persistente ou, com o diretório já carregado, pelo
+        nome de exibição. Só coincidências exatas (e-mail ou nome) são gravadas; as parciais
+        (ex.: "Ana" -> "Ana Paula") valem apenas para esta chamada, para que uma colisão de
+        nomes não fique registrada no mapeamento.
+        """
+        if self.people_mapping:
+            if user_id := self.people_mapping.get_notion_id(member.id):
+                return user_id
+        if user_id := self.user_directory.lookup_exact(member.display_name):
+            if self.people_mapping:
+                self.people_mapping.set(member.id, user_id)
+            return user_id
+        return self.user_directory.lookup(member.display_name)
+
+    async def resolve_member(self, member: discord.abc.User) -> Optional[str]:
+        """
+        Resolve o usuário do Notion de um membro do Discord. Consulta primeiro o mapeamento
+        persistente; se não houver, busca pelo nome de exibição (veja _match_member).
+        """
+        if self.people_mapping:
+            if user_id := self.people_mapping.get_notion_id(member.id):
+                return user_id
+        await self._ensure_user_directory()
+        return self._match_member(member)
+
+    async def resolve_members(self, members) -> List[str]:
+        """
+        Resolve vários membros do Discord de uma vez. Retorna os IDs do Notion encontrados,
+        sem repetição. O diretório de usuários é carregado no máximo uma vez para o lote; se
+        ele não puder ser carregado, apenas os membros já mapeados são resolvidos.
+        """
+        members = list(members)
+        if not self.people_mapping or any(not self.people_mapping.get_notion_id(m.id) for m in members):
+            try:
+                await self._ensure_user_directory()
+            except NotionAPIError as e:
+                print(f"Aviso: {e}")
+        user_ids = []
+        for member in members:
+            user_id = self._match_member(member)
+            if user_id and user_id not in user_ids:
+                user_ids.append(user_id)
+        return user_ids
+
+    async def get_database_count(self, url, progress_callback=None):
+        """
+        Conta todos os cards da base de dados, paginando com payload mínimo (só o título).
+        O resultado fica em cache (com TTL) e é mantido pelos eventos do webhook. Chamadas
+        simultâneas para a mesma base compartilham a mesma contagem; progress_callback
+        (contagem_parcial) é chamado no máximo a cada COUNT_PROGRESS_INTERVAL segundos,
+        sem pausar a contagem.
+        """
+        database_id = self.extract_database_id(url)
+        if not database_id: raise NotionAPIError("ID da base de dados não encontrado na URL.")
+        cached = self.count_cache.get(database_id)
+        if cached is not None:
+            return cached
+        task = self._count_tasks.get(database_id)
+        if task is None:
+            task = asyncio.create_task(self._count_database_pages(database_id, progress_callback))
+            self._count_tasks[database_id] = task
+            task.add_done_callback(lambda _: self._count_tasks.pop(database_id, None))
+        return await asyncio.shield(task)
+
+    async def _count_database_pages(self, database_id: str, progress_callback=None) -> int:
+        count, cursor = 0, None
+        loop = asyncio.get_running_loop()
+        last_report, report_task = loop.time(), None
+        try:
+            while True:
+                query_kwargs = {"database_id": database_id, "page_size": 100, "filter_properties": ["title"]}
+                if cursor: query_kwargs["start_cursor"] = cursor
+                try:
+                    response = await self.notion.databases.query(**query_kwargs)
+                except Exception as e: raise NotionAPIError(f"Erro ao contar páginas no Notion: {e}")
+                count += len(response.get('results', []))
+                if not response.get('has_more'): break
+                cursor = response.get('next_cursor')
+                # O progresso (ex.: edição de mensagem no Discord) é exibido em segundo plano e
+                # com intervalo mínimo, para não pausar a contagem nem estourar o rate limit
+                if (progress_callback and loop.time() - last_report >= COUNT_PROGRESS_INTERVAL
+                        and (report_task is None or report_task.done())):
+                    last_report = loop.time()
+                    report_task = asyncio.create_task(self._report_count_progress(progress_callback, count))
+        finally:
+            # Uma atualização ainda em andamento termina antes do resultado final, sem sobrescrevê-lo
+            if report_task:
+                await report_task
+        self.count_cache.set(database_id, count)
+        return count
+
+    @staticmethod
+    async def _report_count_progress(progress_callback, count: int):
+        # Falhas ao exibir o progresso não interrompem a contagem
+        try:
+            await progress_callback(count)
+        except Exception as e:
+            logging.warning(f"Falha ao informar o progresso da contagem: {e}")
+
+    async def insert_into_database(self, url, properties, children: Optional[List[Dict]] = None):
+        database_id = self.extract_database_id(url)
+        if not database_id:
+            raise NotionAPIError("ID da base de dados não encontrado na URL.")
+
+        # A página é criada com o primeiro lote de blocos; o restante é anexado em lotes de 100
+        children = split_long_text_blocks(children or [])
+        payload = {
+            "parent": {"database_id": database_id},
+            "properties": properties
+        }
+        if children:
+            payload["children"] = children[:MAX_BLOCKS_PER_REQUEST]
+
+        try:
+            page = await self.notion.pages.create(**payload)
+        except Exception as e:
+            raise NotionAPIError(f"Erro ao criar a página no Notion: {e}")
+
+        remaining = children[MAX_BLOCKS_PER_REQUEST:]
+        if remaining:
+            try:
+                await self.append_blocks(page['id'], remaining, existing_count=MAX_BLOCKS_PER_REQUEST)
+            except NotionAPIError as e:
+                # O card já existe: não falha a criação (o que levaria a um card duplicado)
+                logging.error(f"Card {page['id']} criado com conteúdo incompleto: {e}")
+        return page
+
+    async def _child_ids(self, block_id: str) -> List[str]:
+        ids, cursor = [], None
+        while True:
+            kwargs = {"block_id": block_id, "page_size": 100}
+            if cursor: kwargs["start_cursor"] = cursor
+            response = await self.notion.blocks.children.list(**kwargs)
+            ids.extend(block['id'] for block in response.get('results', []))
+            if not response.get('has_more'): return ids
+            cursor = response.get('next_cursor')
+
+    async def append_blocks(self, block_id: str, blocks: List[Dict], existing_count: Optional[int] = None,
+                            after: Optional[str] = None, max_attempts: int = 3) -> Optional[str]:
+        """
+        Anexa blocos a uma página em lotes de até 100 (no final, ou logo depois do bloco
+        'after') e retorna o ID do último bloco anexado. Os lotes de um mesmo bloco pai
+        são enviados em sequência, para que a ordem do conteúdo seja mantida.
+
+        Se um lote falhar, os filhos da página são conferidos antes de tentar de novo:
+        assim, um lote que chegou a ser gravado (ex.: resposta perdida por timeout) não é
+        duplicado, e apenas os blocos que faltam são reenviados.
+        """
+        blocks = split_long_text_blocks(blocks)
+        if existing_count is None:
+            existing_count = len(await self._child_ids(block_id))
+        last_id = None
+        for start in range(0, len(blocks), MAX_BLOCKS_PER_REQUEST):
+            batch = blocks[start:start + MAX_BLOCKS_PER_REQUEST]
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    kwargs = {"block_id": block_id, "children": batch}
+                    if after: kwargs["after"] = after
+                    response = await self.notion.blocks.children.append(**kwargs)
+                    existing_count += len(batch)
+                    ids = [block['id'] for block in response.get('results', [])]
+                    if after in ids: # Resposta com todos os filhos: localiza o lote pela posição
+                        last_id = ids[ids.index(after) + len(batch)]
+                    elif ids:
+                        last_id = ids[-1]
+                    if after: after = last_id
+                    break
+                except Exception as e:
+                    if attempt == max_attempts:
+                        raise NotionAPIError(f"Erro ao anexar blocos no Notion: {e}")
+                    logging.warning(f"Falha ao anexar {len(batch)} blocos em {block_id} ({e}); conferindo o que foi gravado.")
+                    try:
+                        ids = await self._child_ids(block_id)
+                    except Exception as list_error:
+                        raise NotionAPIError(f"Erro ao anexar blocos no Notion: {e} ({list_error})")
+                    written = max(0, len(ids) - existing_count)
+                    if written:
+                        last_id = ids[ids.index(after) + written] if after in ids else ids[-1]
+                        if after: after = last_id
+                    existing_count += written
+                    batch = batch[written:]
+                    if not batch:
+                        break
+        return last_id
+
+    async def append_streamed_text(self, page_id: str, text_stream, after_index: Optional[int] = None,
+                                   flush_interval: float = 2.0, after_id: Optional[str] = None,
+                                   on_append: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Escreve na página um texto em Markdown recebido aos poucos (ex.: resumo da IA em
+        streaming). As linhas completas são convertidas em blocos e anexadas em lotes, no
+        máximo a cada flush_interval segundos, logo depois do bloco after_id ou do filho na
+        posição after_index (ou no final da página). Retorna o texto completo recebido.
+
+        on_append(block_id) recebe o ID do último bloco escrito a cada lote, para que quem
+        chama possa continuar a escrita depois dele (ex.: um aviso se o stream falhar).
+        """
+        child_ids = await self._child_ids(page_id)
+        existing_count = len(child_ids)
+        after = after_id or (child_ids[after_index] if after_index is not None and child_ids else None)
+        received, buffer, last_flush = [], "", time.monotonic()
+
+        async def flush(text: str):
+            nonlocal after, existing_count
+            blocks = self._parse_summary_to_notion_blocks(text)
+            if not blocks:
+                return
+            last_id = await self.append_blocks(page_id, blocks, existing_count=existing_count, after=after)
+            existing_count += len(blocks)
+            if after: after = last_id or after
+            if on_append and last_id: on_append(last_id)
+
+        try:
+            async for piece in text_stream:
+                received.append(piece)
+                buffer += piece
+                if "\n" in buffer and time.monotonic() - last_flush >= flush_interval:
+                    complete, buffer = buffer.rsplit("\n", 1)
+                    await flush(complete)
+                    last_flush = time.monotonic()
+        except Exception:
+            # O stream falhou: as linhas completas já recebidas ainda são escritas
+            if "\n" in buffer:
+                await flush(buffer.rsplit("\n", 1)[0])
+            raise
+        if buffer.strip():
+            await flush(buffer)
+        return "".join(received)
+
+    async def build_page_properties(self, db_url: str, title: str, properties_dict: dict):
+        schema = await self.get_database_properties(db_url)
+        page_properties = {}
+        title_prop_name = next((name for name, data in schema.items() if data['type'] == 'title'), None)
+        if title_prop_name:
+            page_properties[title_prop_name] = await self._format_property_value('title', title)
+
+        for prop_name, prop_value in properties_dict.items():
+            prop_data = schema.get(prop_name)
+            if not prop_data:
+                print(f"AVISO: A propriedade '{prop_name}' não foi encontrada na base de dados. Ela será ignorada.")
+                continue
+            formatted_prop = await self._format_property_value(prop_data.get('type'), prop_value)
+            if formatted_prop:
+                page_properties[prop_name] = formatted_prop
+        return page_properties
+
+    async def build_update_payload(self, prop_name: str, prop_type: str, prop_value):
+        formatted_prop = await self._format_property_value(prop_type, prop_value)
+        if formatted_prop:
+            return {prop_name: formatted_prop}
+        return {}
+
+    async def get_properties_for_interaction(self, url):
+        all_props = await self.get_database_properties(url)
+        return self._properties_for_interaction(all_props)
+
+    async def update_page(self, page_id: str, properties: dict):
         try:
-            return self.notion.pages.update(page_id=page_id, properties=properties)
+            return await self.notion.pages.update(page_id=page_id, properties=properties)
         except Exception as e: raise NotionAPIError(f"Erro ao atualizar a página no Notion: {e}")
 
-    def get_page(self, page_id: str):
+    async def get_page(self, page_id: str):
         try:
-            return self.notion.pages.retrieve(page_id=page_id)
+            return await self.notion.pages.retrieve(page_id=page_id)
         except Exception as e: raise NotionAPIError(f"Erro ao buscar a página no Notion: {e}")
 
-    def delete_page(self, page_id: str):
+    async def delete_page(self, page_id: str):
         """Arquiva (deleta) uma página no Notion."""
         try:
-            return self.notion.pages.update(page_id=page_id, archived=True)
+            return await self.notion.pages.update(page_id=page_id, archived=True)
         except Exception as e:
-            raise NotionAPIError(f"Erro ao deletar (arquivar) a página no Notion: {e}")
\ No newline at end of file
+            raise NotionAPIError(f"Erro ao deletar (arquivar) a página no Notion: {e}")
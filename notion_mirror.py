@@ -0,0 +1,306 @@
+# notion_mirror.py
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any
+
+from config_utils import config_store
+from notion_scheduler import background_priority
+
+MIRROR_DB_PATH = 'notion_mirror.db'
+
+# O Notion arredonda last_edited_time para o minuto; a margem evita perder edições na virada
+SYNC_SAFETY_MARGIN = timedelta(minutes=2)
+
+# Prefixo dos cursores de paginação das buscas respondidas pelo espelho
+MIRROR_CURSOR_PREFIX = 'mirror:'
+
+# Tipos de propriedade indexados para busca por trecho (FTS5) e por valor exato
+TEXT_PROPERTY_TYPES = ('title', 'rich_text')
+VALUE_PROPERTY_TYPES = ('status', 'select', 'multi_select', 'people')
+
+
+# Tabelas do espelho: páginas (JSON), valores exatos, texto indexado (FTS5) e estado da sincronização
+MIRROR_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pages (
+        page_id TEXT PRIMARY KEY,
+        database_id TEXT NOT NULL,
+        last_edited_time TEXT,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS pages_database ON pages (database_id, last_edited_time);
+    CREATE TABLE IF NOT EXISTS page_values (
+        page_id TEXT NOT NULL,
+        database_id TEXT NOT NULL,
+        prop_name TEXT NOT NULL,
+        value TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS page_values_lookup ON page_values (database_id, prop_name, value);
+    CREATE INDEX IF NOT EXISTS page_values_page ON page_values (page_id);
+    CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5(
+        value, page_id UNINDEXED, database_id UNINDEXED, prop_name UNINDEXED,
+        tokenize = 'trigram'
+    );
+    CREATE TABLE IF NOT EXISTS sync_state (
+        database_id TEXT PRIMARY KEY,
+        last_edited_time TEXT
+    );
+"""
+
+
+class NotionMirror:
+    """
+    Espelho local (SQLite + FTS5) das bases de dados do Notion, opcional por canal
+    ('local_mirror_enabled'). É preenchido por uma sincronização completa e mantido
+    pelo webhook e por sincronizações periódicas por last_edited_time, permitindo que
+    o /busca seja respondido localmente em milissegundos.
+
+    A consulta por last_edited_time não traz páginas arquivadas ou na lixeira; por isso,
+    a cada reconcile_interval a sincronização também confere a lista de IDs da base e
+    remove do espelho as páginas que não existem mais (ex.: um page.deleted perdido).
+    """
+    def __init__(self, path: str = MIRROR_DB_PATH, reconcile_interval: float = 3600.0):
+        self.path = path
+        self.reconcile_interval = reconcile_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._sync_locks: Dict[str, asyncio.Lock] = {}
+        self._reconciled_at: Dict[str, float] = {}
+        self._synced: Dict[str, str] = {}
+        self.enabled_databases: set = set()
+
+    def _db(self) -> sqlite3.Connection:
+        """
+        Conexão com o banco SQLite, aberta (e com as tabelas criadas) no primeiro uso:
+        enquanto nenhum canal ativa o espelho, o arquivo nem chega a ser criado.
+        """
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.path, check_same_thread=False)
+                with conn:
+                    conn.executescript(MIRROR_SCHEMA)
+                self._synced = {row[0]: row[1] for row in conn.execute("SELECT database_id, last_edited_time FROM sync_state")}
+                self._conn = conn
+            return self._conn
+
+    def refresh_enabled_databases(self):
+        """Recalcula, a partir das configurações, quais bases têm algum canal com o espelho ativado."""
+        self.enabled_databases = {
+            database_id for database_id in config_store.database_ids()
+            if any(config.get('local_mirror_enabled') for config in config_store.get_for_database(database_id))
+        }
+
+    def is_ready(self, database_id: str) -> bool:
+        """Indica se a base está habilitada e já teve a sincronização completa."""
+        if database_id not in self.enabled_databases:
+            return False
+        self._db() # Carrega o estado da sincronização
+        return database_id in self._synced
+
+    # --- Escrita ---
+
+    @staticmethod
+    def _page_rows(page: Dict[str, Any], database_id: str):
+        text_rows, value_rows = [], []
+        page_id = page['id']
+        for prop_name, prop_data in page.get('properties', {}).items():
+            prop_type = prop_data.get('type')
+            if prop_type in TEXT_PROPERTY_TYPES:
+                text = "".join(part.get('plain_text', '') for part in prop_data.get(prop_type) or [])
+                if text:
+                    text_rows.append((text.casefold(), page_id, database_id, prop_name))
+            elif prop_type in ('status', 'select'):
+                if option := prop_data.get(prop_type):
+                    value_rows.append((page_id, database_id, prop_name, option.get('name', '')))
+            elif prop_type == 'multi_select':
+                for option in prop_data.get('multi_select') or []:
+                    value_rows.append((page_id, database_id, prop_name, option.get('name', '')))
+            elif prop_type == 'people':
+                for person in prop_data.get('people') or []:
+                    value_rows.append((page_id, database_id, prop_name, person.get('id', '')))
+        return text_rows, value_rows
+
+    @staticmethod
+    def _delete_rows(conn: sqlite3.Connection, page_ids: List[str]):
+        for page_id in page_ids:
+            conn.execute("DELETE FROM pages WHERE page_id = ?", (page_id,))
+            conn.execute("DELETE FROM page_values WHERE page_id = ?", (page_id,))
+            conn.execute("DELETE FROM page_text WHERE page_id = ?", (page_id,))
+
+    def _upsert_pages_sync(self, database_id: str, pages: List[Dict[str, Any]]):
+        conn = self._db()
+        with self._lock, conn:
+            self._delete_rows(conn, [page['id'] for page in pages])
+            for page in pages:
+                if page.get('archived') or page.get('in_trash'):
+                    continue
+                text_rows, value_rows = self._page_rows(page, database_id)
+                conn.execute(
+                    "INSERT INTO pages (page_id, database_id, last_edited_time, data) VALUES (?, ?, ?, ?)",
+                    (page['id'], database_id, page.get('last_edited_time'), json.dumps(page)))
+                conn.executemany("INSERT INTO page_text (value, page_id, database_id, prop_name) VALUES (?, ?, ?, ?)", text_rows)
+                conn.executemany("INSERT INTO page_values (page_id, database_id, prop_name, value) VALUES (?, ?, ?, ?)", value_rows)
+
+    def _remove_pages_sync(self, page_ids: List[str]):
+        conn = self._db()
+        with self._lock, conn:
+            self._delete_rows(conn, page_ids)
+
+    def _missing_page_ids_sync(self, database_id: str, existing_ids: set, edited_before: str) -> List[str]:
+        """Páginas do espelho ausentes da base (ignorando as editadas depois de edited_before)."""
+        conn = self._db()
+        with self._lock:
+            rows = conn.execute(
+                "SELECT page_id FROM pages WHERE database_id = ? AND last_edited_time < ?",
+                (database_id, edited_before)).fetchall()
+        return [row[0] for row in rows if row[0] not in existing_ids]
+
+    def _clear_database_sync(self, database_id: str):
+        conn = self._db()
+        with self._lock, conn:
+            conn.execute("DELETE FROM pages WHERE database_id = ?", (database_id,))
+            conn.execute("DELETE FROM page_values WHERE database_id = ?", (database_id,))
+            conn.execute("DELETE FROM page_text WHERE database_id = ?", (database_id,))
+            conn.execute("DELETE FROM sync_state WHERE database_id = ?", (database_id,))
+
+    def _mark_synced_sync(self, database_id: str, last_edited_time: str):
+        conn = self._db()
+        with self._lock, conn:
+            conn.execute(
+                "INSERT INTO sync_state (database_id, last_edited_time) VALUES (?, ?) "
+                "ON CONFLICT(database_id) DO UPDATE SET last_edited_time = excluded.last_edited_time",
+                (database_id, last_edited_time))
+        self._synced[database_id] = last_edited_time
+
+    async def upsert_page(self, database_id: str, page: Dict[str, Any]):
+        await asyncio.to_thread(self._upsert_pages_sync, database_id, [page])
+
+    async def remove_page(self, page_id: str):
+        await asyncio.to_thread(self._remove_pages_sync, [page_id])
+
+    # --- Sincronização ---
+
+    def _sync_lock(self, database_id: str) -> asyncio.Lock:
+        """Lock por base: sincronizações da mesma base (botão e laço periódico) não se sobrepõem."""
+        return self._sync_locks.setdefault(database_id, asyncio.Lock())
+
+    async def full_sync(self, notion, database_id: str):
+        """Recria o espelho da base a partir de uma leitura paginada completa."""
+        async with self._sync_lock(database_id):
+            await self._full_sync(notion, database_id)
+
+    async def _full_sync(self, notion, database_id: str):
+        started_at = (datetime.now(timezone.utc) - SYNC_SAFETY_MARGIN).isoformat()
+        await asyncio.to_thread(self._clear_database_sync, database_id)
+        self._synced.pop(database_id, None)
+        count = 0
+        with background_priority():
+            async for response in notion.iter_database_pages(database_id):
+                pages = response.get('results', [])
+                await asyncio.to_thread(self._upsert_pages_sync, database_id, pages)
+                count += len(pages)
+        await asyncio.to_thread(self._mark_synced_sync, database_id, started_at)
+        self._reconciled_at[database_id] = time.monotonic()
+        logging.info(f"Espelho local do database {database_id} sincronizado ({count} cards).")
+
+    async def delta_sync(self, notion, database_id: str):
+        """
+        Busca apenas as páginas editadas desde a última sincronização (ou faz a completa,
+        se a base ainda não foi sincronizada) e, a cada reconcile_interval, remove as
+        páginas que deixaram de existir.
+        """
+        async with self._sync_lock(database_id):
+            await asyncio.to_thread(self._db) # Carrega o estado da sincronização
+            since = self._synced.get(database_id)
+            if not since:
+                return await self._full_sync(notion, database_id)
+            started_at = (datetime.now(timezone.utc) - SYNC_SAFETY_MARGIN).isoformat()
+            query_filter = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since}}
+            with background_priority():
+                async for response in notion.iter_database_pages(database_id, query_filter=query_filter):
+                    await asyncio.to_thread(self._upsert_pages_sync, database_id, response.get('results', []))
+            if time.monotonic() - self._reconciled_at.get(database_id, float('-inf')) >= self.reconcile_interval:
+                await self._reconcile(notion, database_id, started_at)
+            await asyncio.to_thread(self._mark_synced_sync, database_id, started_at)
+
+    async def _reconcile(self, notion, database_id: str, started_at: str):
+        """Remove do espelho as páginas arquivadas ou apagadas, comparando os IDs com os da base."""
+        existing_ids = set()
+        with background_priority():
+            async for response in notion.iter_database_pages(database_id, filter_properties=["title"]):
+                existing_ids.update(page['id'] for page in response.get('results', []))
+        # Páginas editadas durante a listagem (ex.: criadas via webhook) ficam para a próxima vez
+        missing = await asyncio.to_thread(self._missing_page_ids_sync, database_id, existing_ids, started_at)
+        if missing:
+            await asyncio.to_thread(self._remove_pages_sync, missing)
+            logging.info(f"Espelho local do database {database_id}: {len(missing)} cards removidos na reconciliação.")
+        self._reconciled_at[database_id] = time.monotonic()
+
+    async def run_periodic_sync(self, notion, interval: float = 300.0):
+        """Laço em segundo plano: sincroniza (delta) todas as bases com o espelho ativado."""
+        while True:
+            self.refresh_enabled_databases()
+            for database_id in list(self.enabled_databases):
+                try:
+                    await self.delta_sync(notion, database_id)
+                except Exception as e:
+                    logging.error(f"Erro ao sincronizar o espelho local do database {database_id}: {e}", exc_info=True)
+            await asyncio.sleep(interval)
+
+    # --- Busca ---
+
+    def _search_sync(self, database_id: str, filter_property: str, property_type: str, value: str,
+                     limit: int, offset: int) -> List[Dict[str, Any]]:
+        conn = self._db()
+        with self._lock:
+            if property_type in TEXT_PROPERTY_TYPES:
+                term = value.casefold()
+                if len(term) >= 3:
+                    # Com o tokenizer trigram, uma frase entre aspas equivale a "contém"
+                    match_expr = '"' + term.replace('"', '""') + '"'
+                    condition, param = "page_text MATCH ?", match_expr
+                else:
+                    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                    condition, param = "value LIKE ? ESCAPE '\\'", f"%{escaped}%"
+                rows = conn.execute(
+                    f"SELECT p.data FROM pages p WHERE p.page_id IN ("
+                    f"SELECT page_id FROM page_text WHERE {condition} AND database_id = ? AND prop_name = ?) "
+                    f"ORDER BY p.last_edited_time DESC LIMIT ? OFFSET ?",
+                    (param, database_id, filter_property, limit, offset)).fetchall()
+            elif property_type in VALUE_PROPERTY_TYPES:
+                rows = conn.execute(
+                    "SELECT p.data FROM pages p WHERE p.page_id IN ("
+                    "SELECT page_id FROM page_values WHERE database_id = ? AND prop_name = ? AND value = ?) "
+                    "ORDER BY p.last_edited_time DESC LIMIT ? OFFSET ?",
+                    (database_id, filter_property, value, limit, offset)).fetchall()
+            else:
+                return []
+        return [json.loads(row[0]) for row in rows]
+
+    async def search(self, database_id: str, filter_property: str, property_type: str, value: str,
+                     page_size: Optional[int] = None, start_cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Busca no espelho, no mesmo formato de resposta da API ('results', 'has_more',
+        'next_cursor'). Com page_size, os resultados são paginados por cursores próprios
+        (prefixo MIRROR_CURSOR_PREFIX).
+        """
+        offset = int(start_cursor[len(MIRROR_CURSOR_PREFIX):]) if start_cursor else 0
+        # Um resultado a mais indica se há próxima página
+        limit = page_size + 1 if page_size else -1
+        results = await asyncio.to_thread(self._search_sync, database_id, filter_property, property_type, value, limit, offset)
+        has_more = bool(page_size) and len(results) > page_size
+        if has_more:
+            results = results[:page_size]
+        return {"results": results, "has_more": has_more,
+                "next_cursor": f"{MIRROR_CURSOR_PREFIX}{offset + page_size}" if has_more else None}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
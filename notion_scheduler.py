@@ -0,0 +1,216 @@
+# notion_scheduler.py
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+from notion_client import AsyncClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+
+# Prioridades das requisições (menor valor = atendida primeiro)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Prioridade da tarefa atual. Comandos e botões usam o padrão (interativa);
+# webhooks e sincronizações marcam o próprio trabalho com background_priority().
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar('notion_request_priority', default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def background_priority():
+    """Executa as chamadas ao Notion do bloco com prioridade de segundo plano."""
+    token = request_priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+def _is_idempotent(method: str, path: str) -> bool:
+    """Indica se a requisição pode ser repetida com segurança após um erro 5xx ou timeout."""
+    method = method.upper()
+    if method in ('GET', 'DELETE'):
+        return True
+    if method == 'POST':
+        # Consultas e buscas são POST, mas não alteram nada
+        return path.rstrip('/').endswith(('/query', 'search'))
+    if method == 'PATCH':
+        # Atualizar propriedades de uma página é idempotente; acrescentar blocos não é
+        return not path.rstrip('/').endswith('/children')
+    return False
+
+
+def _is_read(method: str, path: str) -> bool:
+    """Requisições que apenas leem dados (podem ser compartilhadas entre chamadas idênticas)."""
+    method = method.upper()
+    return method == 'GET' or (method == 'POST' and path.rstrip('/').endswith(('/query', 'search')))
+
+
+def _retry_after(error: HTTPResponseError) -> Optional[float]:
+    value = error.headers.get('Retry-After') if error.headers else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class NotionRequestScheduler:
+    """
+    Ponto único por onde passam as requisições ao Notion:
+
+    - token bucket de ~3 requisições/segundo (limite médio da API por integração),
+      com fila de prioridade: chamadas interativas passam à frente das de segundo plano;
+    - em 429, respeita o Retry-After e pausa todas as requisições até lá;
+    - em 429/5xx/timeout, repete com backoff exponencial com jitter (5xx e timeouts
+      apenas para requisições idempotentes).
+    """
+    def __init__(self, rate: float = 3.0, burst: int = 3, max_retries: int = 5,
+                 base_delay: float = 0.5, max_delay: float = 30.0):
+        self.rate, self.burst = rate, burst
+        self.max_retries, self.base_delay, self.max_delay = max_retries, base_delay, max_delay
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.throttled = 0
+        self.retries = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _try_take(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        if now >= self._paused_until and self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self, priority: int):
+        """Aguarda uma ficha do bucket, respeitando a prioridade e as pausas por 429."""
+        if not self._waiters and self._try_take():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="notion-scheduler")
+        await future
+
+    async def _dispatch(self):
+        while self._waiters:
+            if self._waiters[0][2].cancelled():
+                heapq.heappop(self._waiters)
+                continue
+            if self._try_take():
+                heapq.heappop(self._waiters)[2].set_result(None)
+                continue
+            now = time.monotonic()
+            wait_for_token = (1 - self._tokens) / self.rate
+            await asyncio.sleep(max(wait_for_token, self._paused_until - now, 0.01))
+
+    def pause(self, seconds: float):
+        """Suspende novas requisições (todas as prioridades) pelo tempo informado."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def run(self, method: str, path: str, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa a requisição pelo bucket, repetindo-a em caso de erros transitórios."""
+        priority = request_priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(priority)
+            try:
+                return await send()
+            except HTTPResponseError as e:
+                if e.status == 429:
+                    self.throttled += 1
+                    delay = _retry_after(e)
+                    if delay is not None:
+                        self.pause(delay)
+                    else:
+                        delay = self._backoff(attempt)
+                elif e.status >= 500 and _is_idempotent(method, path):
+                    delay = self._backoff(attempt)
+                else:
+                    raise
+                error = e
+            except (RequestTimeoutError, httpx.TransportError) as e:
+                if not _is_idempotent(method, path):
+                    raise
+                delay, error = self._backoff(attempt), e
+            if attempt == self.max_retries:
+                raise error
+            self.retries += 1
+            logging.warning(f"Notion: {method} {path} falhou ({error}); nova tentativa em {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "tokens": round(self._tokens, 2),
+            "waiting": len(self._waiters),
+            "throttled": self.throttled,
+            "retries": self.retries,
+        }
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas idênticas e simultâneas: a primeira executa a requisição e as
+    demais aguardam o mesmo resultado (ou a mesma exceção). Nada é guardado depois
+    que a requisição termina; isso fica a cargo dos caches.
+    """
+    def __init__(self):
+        self._calls: dict[Any, asyncio.Task] = {}
+        self.shared = 0
+
+    def _forget(self, key: Any, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Evita o aviso de exceção não lida quando todos desistiram
+
+    async def do(self, key: Any, call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+        # Um chamador cancelado não cancela a requisição dos demais
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "shared": self.shared}
+
+
+class ScheduledAsyncClient(AsyncClient):
+    """
+    AsyncClient do Notion cujas requisições passam pelo NotionRequestScheduler.
+    Leituras idênticas e simultâneas (mesmo método, caminho e parâmetros) são
+    feitas uma única vez e o resultado é compartilhado.
+    """
+    def __init__(self, scheduler: NotionRequestScheduler, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+        self.single_flight = SingleFlight()
+
+    async def request(self, path: str, method: str, query=None, body=None, auth=None) -> Any:
+        send = super().request
+        scheduled = lambda: self.scheduler.run(method, path, lambda: send(path, method, query, body, auth))
+        if not _is_read(method, path):
+            return await scheduled()
+        key = (method.upper(), path, json.dumps(query, sort_keys=True), json.dumps(body, sort_keys=True), auth)
+        return await self.single_flight.do(key, scheduled)
@@ -0,0 +1,80 @@
+# page_snapshots.py
+
+import hashlib
+from typing import Dict, Any, List, Optional
+
+from config_utils import JsonFileStore
+
+PAGE_SNAPSHOTS_FILE_PATH = 'page_snapshots.json'
+
+# Quantidade máxima de páginas lembradas; as menos recentes são descartadas primeiro
+MAX_TRACKED_PAGES = 5000
+
+
+def _value_hash(value: str) -> str:
+    normalized = " ".join(str(value).casefold().split())
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class PageSnapshotStore(JsonFileStore):
+    """
+    Último estado conhecido das propriedades observadas por regras de notificação,
+    guardado por página como hashes curtos de cada valor (compacto e persistente).
+    Comparar o estado atual com o snapshot permite distinguir uma transição real
+    ("Status passou a ser Concluído") de uma edição qualquer no card.
+
+    As páginas são mantidas em ordem de uso (LRU) e as mais antigas são descartadas
+    acima de max_pages.
+    """
+    def __init__(self, path: str = PAGE_SNAPSHOTS_FILE_PATH, max_pages: int = MAX_TRACKED_PAGES,
+                 flush_delay: float = 5.0):
+        super().__init__(path, flush_delay)
+        self.max_pages = max_pages
+
+    def get(self, page_id: str) -> Optional[Dict[str, List[str]]]:
+        return self._load().get(page_id)
+
+    def diff(self, page_id: str, values: Dict[str, List[str]],
+             changed_properties: Optional[set] = None) -> Dict[str, List[str]]:
+        """
+        Atualiza o snapshot da página e retorna, por propriedade, os valores que
+        passaram a estar presentes desde o último estado conhecido.
+
+        Quando não há estado anterior para uma propriedade (página nova no snapshot ou
+        regra recém-criada), a transição só é considerada se o próprio evento informou
+        que a propriedade mudou (changed_properties, por nome).
+        """
+        data = self._load()
+        with self._lock:
+            previous = data.pop(page_id, None)
+            current = {prop_name: sorted({_value_hash(value) for value in prop_values})
+                       for prop_name, prop_values in values.items()}
+            if previous:
+                # Preserva as propriedades que deixaram de ser observadas nesta chamada
+                current = {**previous, **current}
+            data[page_id] = current
+            while len(data) > self.max_pages:
+                del data[next(iter(data))]
+            if current != previous:
+                self._mark_dirty()
+
+        transitions = {}
+        for prop_name, prop_values in values.items():
+            old_hashes = (previous or {}).get(prop_name)
+            if old_hashes is None:
+                if changed_properties is None or prop_name not in changed_properties:
+                    continue
+                old_hashes = []
+            new_values = [value for value in prop_values if _value_hash(value) not in old_hashes]
+            if new_values:
+                transitions[prop_name] = new_values
+        return transitions
+
+    def remove(self, page_id: str):
+        data = self._load()
+        with self._lock:
+            if data.pop(page_id, None) is not None:
+                self._mark_dirty()
+
+
+page_snapshots = PageSnapshotStore()
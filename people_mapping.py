@@ -0,0 +1,58 @@
+# people_mapping.py
+
+from typing import Optional, Dict, Any
+
+from config_utils import JsonFileStore
+
+PEOPLE_MAPPING_FILE_PATH = 'people_mapping.json'
+
+
+class PeopleMappingStore(JsonFileStore):
+    """
+    Mapeamento persistente entre usuários do Discord e usuários do Notion.
+    Preenchido automaticamente na primeira resolução por e-mail ou nome exato,
+    ou manualmente por um administrador (que tem prioridade sobre o automático).
+    """
+    def __init__(self, path: str = PEOPLE_MAPPING_FILE_PATH, flush_delay: float = 1.0):
+        super().__init__(path, flush_delay)
+        self._by_notion_id: Dict[str, str] = {}
+
+    def _on_load(self, data: Dict[str, Any]):
+        self._by_notion_id = {entry["notion_user_id"]: discord_id for discord_id, entry in data.items()}
+
+    def get_notion_id(self, discord_user_id: int) -> Optional[str]:
+        entry = self._load().get(str(discord_user_id))
+        return entry["notion_user_id"] if entry else None
+
+    def get_discord_id(self, notion_user_id: str) -> Optional[int]:
+        self._load()
+        discord_id = self._by_notion_id.get(notion_user_id)
+        return int(discord_id) if discord_id else None
+
+    def set(self, discord_user_id: int, notion_user_id: str, manual: bool = False):
+        """Registra um mapeamento. Mapeamentos automáticos nunca sobrescrevem os manuais."""
+        data = self._load()
+        key = str(discord_user_id)
+        with self._lock:
+            current = data.get(key)
+            if current and not manual and (current.get("manual") or current["notion_user_id"] == notion_user_id):
+                return
+            if current and self._by_notion_id.get(current["notion_user_id"]) == key:
+                del self._by_notion_id[current["notion_user_id"]]
+            data[key] = {"notion_user_id": notion_user_id, "manual": manual}
+            self._by_notion_id[notion_user_id] = key
+            self._mark_dirty()
+
+    def remove(self, discord_user_id: int) -> bool:
+        data = self._load()
+        with self._lock:
+            entry = data.pop(str(discord_user_id), None)
+            if not entry:
+                return False
+            if self._by_notion_id.get(entry["notion_user_id"]) == str(discord_user_id):
+                del self._by_notion_id[entry["notion_user_id"]]
+            self._mark_dirty()
+            return True
+
+
+people_mapping = PeopleMappingStore()
@@ -0,0 +1,119 @@
+# question_answering.py
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from ia_processor import answer_question
+from summarizers import STOPWORDS, WORD_PATTERN
+
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+ANSWER_CACHE_MAX_ENTRIES = 256
+MAX_CONTEXT_PAGES = 5
+MAX_SEARCH_TERMS = 3
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.casefold().split())
+
+
+class AnswerCache:
+    """
+    Respostas recentes por pergunta normalizada (e base do Notion usada como contexto),
+    com TTL curto, já que os cards mudam, e descarte LRU acima de max_entries.
+    """
+    def __init__(self, ttl: float = ANSWER_CACHE_TTL, max_entries: int = ANSWER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Tuple[str, Optional[str]], Tuple[float, str]] = OrderedDict()
+
+    def get(self, key: Tuple[str, Optional[str]]) -> Optional[str]:
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        if time.monotonic() - entry[0] >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Tuple[str, Optional[str]], answer: str):
+        self._entries[key] = (time.monotonic(), answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+answer_cache = AnswerCache()
+
+
+def _search_terms(question: str) -> List[str]:
+    """Palavras mais longas (e portanto mais específicas) da pergunta, sem stopwords."""
+    words = [word for word in WORD_PATTERN.findall(question.casefold())
+             if len(word) > 3 and word not in STOPWORDS]
+    return sorted(dict.fromkeys(words), key=len, reverse=True)[:MAX_SEARCH_TERMS]
+
+
+async def notion_context(notion, config: dict, question: str) -> str:
+    """
+    Busca, pelo título, cards da base do canal relacionados à pergunta (usando o espelho
+    local quando disponível) e os formata como texto para o prompt.
+    """
+    terms = _search_terms(question)
+    if not terms:
+        return ""
+    schema = await notion.get_database_properties(config['notion_url'])
+    title_prop = next((name for name, data in schema.items() if data['type'] == 'title'), None)
+    if not title_prop:
+        return ""
+    responses = await asyncio.gather(*[
+        notion.search_in_database(config['notion_url'], term, title_prop, 'title', page_size=MAX_CONTEXT_PAGES)
+        for term in terms], return_exceptions=True)
+
+    pages = {}
+    for response in responses:
+        if isinstance(response, Exception):
+            logging.warning(f"Busca de contexto no Notion falhou: {response}")
+            continue
+        for page in response.get('results', []):
+            pages.setdefault(page['id'], page)
+    display_props = config.get('display_properties') or list(schema)
+
+    sections = []
+    for page in list(pages.values())[:MAX_CONTEXT_PAGES]:
+        lines = []
+        for prop_name in [title_prop] + [name for name in display_props if name != title_prop]:
+            prop_data = page.get('properties', {}).get(prop_name)
+            value = notion.extract_value_from_property(prop_data, prop_data.get('type')) if prop_data else None
+            if value:
+                lines.append(f"{prop_name}: {value}")
+        lines.append(f"Link: {page.get('url', '')}")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+async def ask(question: str, guild_id: Any = None, notion=None, config: Optional[dict] = None) -> str:
+    """
+    Responde a uma pergunta, com os cards da base do canal como contexto quando
+    'notion' e a configuração do canal forem informados. Perguntas repetidas dentro
+    do TTL são respondidas pelo cache, sem chamar o modelo.
+    """
+    use_notion = bool(notion and config and config.get('notion_url'))
+    key = (normalize_question(question), notion.extract_database_id(config['notion_url']) if use_notion else None)
+    cached_answer = answer_cache.get(key)
+    if cached_answer is not None:
+        return cached_answer
+
+    context = ""
+    if use_notion:
+        try:
+            context = await notion_context(notion, config, question)
+        except Exception as e:
+            logging.warning(f"Não foi possível buscar contexto no Notion para a pergunta: {e}")
+    answer = await answer_question(question, context, guild_id)
+    if not answer.startswith("Erro"):
+        answer_cache.set(key, answer)
+    return answer
@@ -0,0 +1,177 @@
+# summarizers.py
+
+import asyncio
+import math
+import re
+from collections import Counter
+from typing import AsyncIterator, Dict, List, Optional, Protocol
+
+import discord
+
+import ia_processor
+from ia_processor import _conversation_lines
+
+
+class Summarizer(Protocol):
+    """Backend de resumo de tópicos. O texto gerado usa o mesmo Markdown simples do resumo da IA."""
+    name: str
+    label: str
+
+    async def summarize(self, messages: List[discord.Message]) -> str: ...
+
+    def stream(self, messages: List[discord.Message]) -> AsyncIterator[str]: ...
+
+
+class GeminiSummarizer:
+    """Resumo gerado pelo Gemini (cache, resumo incremental e map-reduce em ia_processor)."""
+    name = 'gemini'
+    label = "Gemini (IA do Google)"
+
+    async def summarize(self, messages: List[discord.Message]) -> str:
+        return await ia_processor.summarize_thread_content(messages)
+
+    def stream(self, messages: List[discord.Message]) -> AsyncIterator[str]:
+        return ia_processor.stream_thread_summary(messages)
+
+
+# Palavras muito comuns que não ajudam a comparar frases
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela pelos pelas para pra
+com sem sob sobre entre até após e ou mas que se não nao sim é ser são foi era está estao estão
+tem ter têm há isso isto esse essa este esta aquele aquela ele ela eles elas eu tu você voce vocês
+nós nos me te lhe meu minha seu sua já ja muito mais menos também tambem só so ainda então entao
+aqui ali lá la como quando onde porque porquê qual quais quem ao aos à às né ne tá ta vai vou
+""".split())
+
+URL_PATTERN = re.compile(r'https?://\S+')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class LocalSummarizer:
+    """
+    Resumo extrativo local (TextRank sobre TF-IDF), sem chamadas de rede: escolhe as
+    frases mais representativas da conversa e as mantém em ordem cronológica, junto
+    com os links compartilhados. Determinístico e rápido: roda em milissegundos
+    para conversas de algumas centenas de mensagens.
+    """
+    name = 'local'
+    label = "Local (extrativo, offline)"
+
+    def __init__(self, max_sentences: int = 7, max_candidates: int = 300, max_neighbors: int = 15,
+                 damping: float = 0.85, iterations: int = 30, tolerance: float = 1e-6):
+        self.max_sentences = max_sentences
+        self.max_candidates = max_candidates
+        self.max_neighbors = max_neighbors
+        self.damping = damping
+        self.iterations = iterations
+        self.tolerance = tolerance
+
+    @staticmethod
+    def _words(text: str) -> List[str]:
+        return [word for word in WORD_PATTERN.findall(text.casefold())
+                if len(word) > 2 and word not in STOPWORDS and not word.isdigit()]
+
+    def _sentences(self, messages: List[discord.Message]) -> List[str]:
+        sentences, seen = [], set()
+        for line in _conversation_lines(messages):
+            author, _, content = line.rstrip("\n").partition(": ")
+            for sentence in SENTENCE_PATTERN.split(URL_PATTERN.sub("", content)):
+                sentence = sentence.strip()
+                key = " ".join(self._words(sentence))
+                # Frases repetidas (ex.: mensagens coladas de novo) entram uma vez só
+                if len(key.split()) >= 2 and key not in seen:
+                    seen.add(key)
+                    sentences.append(f"{author}: {sentence}")
+        # Em conversas muito longas, considera as frases mais recentes (o grafo cresce com o quadrado)
+        return sentences[-self.max_candidates:]
+
+    def _rank(self, sentences: List[str]) -> List[float]:
+        words = [self._words(sentence.partition(": ")[2]) for sentence in sentences]
+        document_frequency = Counter(word for sentence_words in words for word in set(sentence_words))
+        total = len(sentences)
+        vectors = []
+        for sentence_words in words:
+            counts = Counter(sentence_words)
+            vector = {word: count * math.log(1 + total / document_frequency[word]) for word, count in counts.items()}
+            norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+            vectors.append({word: value / norm for word, value in vector.items()})
+
+        # Grafo de similaridade (cosseno) entre as frases, via índice invertido:
+        # só são comparados os pares que têm alguma palavra em comum
+        postings: Dict[str, List[int]] = {}
+        for i, vector in enumerate(vectors):
+            for word in vector:
+                postings.setdefault(word, []).append(i)
+        neighbors: List[Dict[int, float]] = [{} for _ in sentences]
+        for word, indexes in postings.items():
+            for position, i in enumerate(indexes):
+                weight_i = vectors[i][word]
+                for j in indexes[position + 1:]:
+                    similarity = weight_i * vectors[j][word]
+                    neighbors[i][j] = neighbors[i].get(j, 0.0) + similarity
+                    neighbors[j][i] = neighbors[j].get(i, 0.0) + similarity
+        # Mantém só as arestas mais fortes de cada frase (grafo esparso, PageRank mais barato)
+        strongest = [dict(sorted(edges.items(), key=lambda edge: edge[1], reverse=True)[:self.max_neighbors])
+                     for edges in neighbors]
+        for i, edges in enumerate(strongest):
+            for j, weight in edges.items():
+                strongest[j].setdefault(i, weight)
+        weight_sums = [sum(edges.values()) for edges in strongest]
+
+        scores = [1.0 / total] * total
+        for _ in range(self.iterations):
+            new_scores = [
+                (1 - self.damping) / total + self.damping * sum(
+                    scores[j] * weight / weight_sums[j] for j, weight in strongest[i].items())
+                for i in range(total)]
+            converged = max(abs(new - old) for new, old in zip(new_scores, scores)) < self.tolerance
+            scores = new_scores
+            if converged:
+                break
+        return scores
+
+    def _summarize_sync(self, messages: List[discord.Message]) -> str:
+        sentences = self._sentences(messages)
+        links = list(dict.fromkeys(URL_PATTERN.findall("".join(_conversation_lines(messages)))))
+        if not sentences and not links:
+            return ""
+        parts = []
+        if sentences:
+            scores = self._rank(sentences)
+            limit = min(self.max_sentences, max(3, len(sentences) // 10))
+            chosen = sorted(sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True)[:limit])
+            parts.append("**Pontos principais:**")
+            parts.extend(f"- {sentences[i]}" for i in chosen)
+        if links:
+            parts.append("**Links compartilhados:**")
+            parts.extend(f"- {link}" for link in links)
+        return "\n".join(parts)
+
+    async def summarize(self, messages: List[discord.Message]) -> str:
+        return await asyncio.to_thread(self._summarize_sync, messages)
+
+    async def stream(self, messages: List[discord.Message]) -> AsyncIterator[str]:
+        summary = await self.summarize(messages)
+        if summary:
+            yield summary
+
+
+SUMMARIZERS: Dict[str, Summarizer] = {
+    GeminiSummarizer.name: GeminiSummarizer(),
+    LocalSummarizer.name: LocalSummarizer(),
+}
+
+
+def get_summarizer(config: dict) -> Optional[Summarizer]:
+    """
+    Backend escolhido para o canal em 'ai_summary_enabled': False/ausente desativa o
+    resumo, True (configurações antigas) usa o Gemini e um nome ('gemini', 'local')
+    escolhe o backend.
+    """
+    choice = config.get('ai_summary_enabled')
+    if not choice:
+        return None
+    if choice is True:
+        return SUMMARIZERS[GeminiSummarizer.name]
+    return SUMMARIZERS.get(choice, SUMMARIZERS[GeminiSummarizer.name])
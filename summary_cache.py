@@ -0,0 +1,72 @@
+# summary_cache.py
+
+import hashlib
+import os
+import time
+from typing import Optional
+
+from config_utils import JsonFileStore
+
+SUMMARY_CACHE_FILE_PATH = 'summary_cache.json'
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(7 * 24 * 3600)))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "500"))
+
+
+def transcript_hash(transcript: str) -> str:
+    return hashlib.sha256(transcript.encode('utf-8')).hexdigest()[:32]
+
+
+class SummaryCache(JsonFileStore):
+    """
+    Resumos da IA já gerados, por tópico, junto com o hash da transcrição que os
+    originou. Se o tópico não recebeu mensagens novas, o hash é o mesmo e o resumo
+    é reaproveitado sem chamar o modelo. O ID da última mensagem resumida permite
+    atualizar o resumo só com as mensagens novas. Entradas expiram após o TTL e,
+    acima de max_entries, as menos usadas recentemente são descartadas.
+    """
+    def __init__(self, path: str = SUMMARY_CACHE_FILE_PATH, ttl: float = SUMMARY_CACHE_TTL,
+                 max_entries: int = SUMMARY_CACHE_MAX_ENTRIES, flush_delay: float = 1.0):
+        super().__init__(path, flush_delay)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, thread_id: int, transcript: str) -> Optional[str]:
+        data = self._load()
+        key = str(thread_id)
+        with self._lock:
+            entry = data.get(key)
+            if not entry or entry["hash"] != transcript_hash(transcript) \
+                    or time.time() - entry["created_at"] >= self.ttl:
+                self.misses += 1
+                return None
+            # Move para o fim (mais recente) na ordem de descarte. Só a memória é alterada:
+            # a ordem vai para o disco junto com a próxima gravação (set)
+            data[key] = data.pop(key)
+            self.hits += 1
+            return entry["summary"]
+
+    def get_entry(self, thread_id: int) -> Optional[dict]:
+        """Último resumo do tópico (mesmo que a transcrição tenha mudado), se ainda não expirou."""
+        entry = self._load().get(str(thread_id))
+        if entry and time.time() - entry["created_at"] < self.ttl:
+            return dict(entry)
+        return None
+
+    def set(self, thread_id: int, transcript: str, summary: str, last_message_id: Optional[int] = None):
+        data = self._load()
+        key = str(thread_id)
+        with self._lock:
+            data.pop(key, None)
+            data[key] = {"hash": transcript_hash(transcript), "summary": summary,
+                         "last_message_id": last_message_id, "created_at": time.time()}
+            now = time.time()
+            for expired in [k for k, entry in data.items() if now - entry["created_at"] >= self.ttl]:
+                del data[expired]
+            while len(data) > self.max_entries:
+                del data[next(iter(data))]
+            self._mark_dirty()
+
+
+summary_cache = SummaryCache()
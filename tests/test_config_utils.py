@@ -0,0 +1,78 @@
+import config_utils
+from config_utils import ConfigStore, load_config, save_config
+
+DATABASE_A = "0123456789abcdef0123456789abcdef"
+DATABASE_B = "fedcba9876543210fedcba9876543210"
+
+
+def url(database_id: str) -> str:
+    return f"https://www.notion.so/workspace/{database_id}?v=1"
+
+
+def make_store(tmp_path) -> ConfigStore:
+    return ConfigStore(str(tmp_path / "configs.json"), flush_delay=60)
+
+
+def channels(store: ConfigStore, database_id: str) -> list[str]:
+    return sorted(config["channel_id"] for config in store.get_for_database(database_id))
+
+
+def test_update_indexes_channels_by_database(tmp_path):
+    store = make_store(tmp_path)
+    store.update(1, 10, {"notion_url": url(DATABASE_A)})
+    store.update(1, 11, {"notion_url": url(DATABASE_A)})
+    assert channels(store, DATABASE_A) == ["10", "11"]
+    assert channels(store, url(DATABASE_A)) == ["10", "11"]
+    assert store.database_ids() == [DATABASE_A]
+
+
+def test_changing_notion_url_moves_the_channel(tmp_path):
+    store = make_store(tmp_path)
+    store.update(1, 10, {"notion_url": url(DATABASE_A)})
+    store.update(1, 11, {"notion_url": url(DATABASE_A)})
+    store.update(1, 10, {"notion_url": url(DATABASE_B)})
+    assert channels(store, DATABASE_A) == ["11"]
+    assert channels(store, DATABASE_B) == ["10"]
+    store.update(1, 11, {"notion_url": url(DATABASE_B)})
+    assert store.get_for_database(DATABASE_A) == []
+    assert store.database_ids() == [DATABASE_B]
+
+
+def test_removing_notion_url_unindexes_the_channel(tmp_path):
+    store = make_store(tmp_path)
+    store.update(1, 10, {"notion_url": url(DATABASE_A)})
+    store.update(1, 10, {"notion_url": None})
+    assert store.get_for_database(DATABASE_A) == []
+    assert store.database_ids() == []
+
+
+def test_unrelated_updates_keep_the_index_and_bump_the_version(tmp_path):
+    store = make_store(tmp_path)
+    store.update(1, 10, {"notion_url": url(DATABASE_A)})
+    version = store.version
+    store.update(1, 10, {"notification_rules": []})
+    assert store.version == version + 1
+    assert channels(store, DATABASE_A) == ["10"]
+    assert store.get_for_database(DATABASE_A)[0]["notification_rules"] == []
+
+
+def test_index_is_rebuilt_when_loading_from_disk(tmp_path):
+    store = make_store(tmp_path)
+    store.update(1, 10, {"notion_url": url(DATABASE_A)})
+    store.update(2, 20, {"notion_url": url(DATABASE_B)})
+    store.flush()
+    reloaded = make_store(tmp_path)
+    assert sorted(reloaded.database_ids()) == sorted([DATABASE_A, DATABASE_B])
+    assert [(c["guild_id"], c["channel_id"]) for c in reloaded.get_for_database(DATABASE_B)] == [("2", "20")]
+
+
+def test_save_config_goes_through_the_shared_store(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    monkeypatch.setattr(config_utils, "config_store", store)
+    save_config(1, 10, {"notion_url": url(DATABASE_A)})
+    version = store.version
+    save_config(1, 10, {"notion_url": url(DATABASE_B)})
+    assert store.version == version + 1
+    assert store.get_for_database(DATABASE_A) == []
+    assert channels(store, DATABASE_B) == ["10"]
+    assert load_config(1, 10)["notion_url"] == url(DATABASE_B)
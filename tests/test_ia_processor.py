@@ -0,0 +1,159 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import ia_processor
+from ia_processor import FairLimiter, current_guild
+
+
+def test_limiter_never_exceeds_max_concurrent():
+    async def scenario():
+        limiter, running, peak = FairLimiter(2), [0], [0]
+
+        async def call(guild_id):
+            current_guild.set(guild_id)
+            async with limiter:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+                await asyncio.sleep(0.01)
+                running[0] -= 1
+
+        await asyncio.gather(*[call(i % 3) for i in range(10)])
+        assert peak[0] == 2
+        assert limiter.active == 0 and limiter.waiting() == 0
+    asyncio.run(scenario())
+
+
+def test_busy_guild_does_not_starve_the_others():
+    async def scenario():
+        limiter, order = FairLimiter(1), []
+        await limiter.acquire("holder")
+
+        async def call(guild_id, name):
+            await limiter.acquire(guild_id)
+            order.append(name)
+            limiter.release()
+
+        # Rajada do servidor A chega antes dos pedidos de B e C
+        tasks = [asyncio.create_task(call("A", f"A{i}")) for i in range(3)]
+        tasks += [asyncio.create_task(call("B", "B0")), asyncio.create_task(call("C", "C0"))]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        assert order == ["A0", "B0", "C0", "A1", "A2"]
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_hands_the_slot_to_the_next_one():
+    async def scenario():
+        limiter = FairLimiter(1)
+        await limiter.acquire("A")
+        cancelled = asyncio.create_task(limiter.acquire("B"))
+        waiting = asyncio.create_task(limiter.acquire("C"))
+        await asyncio.sleep(0)
+        # A vaga é concedida a B e o pedido é cancelado antes de B acordar
+        limiter.release()
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await asyncio.wait_for(waiting, timeout=1)
+        assert limiter.active == 1
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_is_skipped_on_release():
+    async def scenario():
+        limiter = FairLimiter(1)
+        await limiter.acquire("A")
+        cancelled = asyncio.create_task(limiter.acquire("B"))
+        waiting = asyncio.create_task(limiter.acquire("C"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.wait_for(waiting, timeout=1)
+        assert limiter.active == 1
+    asyncio.run(scenario())
+
+
+class FakeStreamingModel:
+    def __init__(self, chunks, error: Exception | None = None):
+        self.chunks, self.error = chunks, error
+
+    async def generate_content_async(self, prompt, stream=False):
+        async def response():
+            for text in self.chunks:
+                yield SimpleNamespace(text=text)
+            if self.error:
+                raise self.error
+        return response()
+
+
+@pytest.fixture
+def streaming(monkeypatch):
+    """stream_thread_summary com um modelo falso e sem cache de resumos."""
+    limiter = FairLimiter(1)
+    monkeypatch.setattr(ia_processor, "gemini_limiter", limiter)
+    monkeypatch.setattr(ia_processor, "_prepare", lambda messages: (["a: oi\n"], None))
+
+    async def plan_summary(messages, lines):
+        return None, "prompt"
+    monkeypatch.setattr(ia_processor, "_plan_summary", plan_summary)
+    cached = []
+    monkeypatch.setattr(ia_processor.summary_cache, "set", lambda *args, **kwargs: cached.append(args[2]))
+    messages = [SimpleNamespace(id=1, channel=SimpleNamespace(id=10))]
+    return limiter, messages, cached
+
+
+def test_streamed_summary_releases_the_slot_before_the_consumer_finishes(streaming, monkeypatch):
+    limiter, messages, cached = streaming
+    monkeypatch.setattr(ia_processor, "_model", FakeStreamingModel(["Um ", "resumo"]))
+
+    async def scenario():
+        received = []
+        async for text in ia_processor.stream_thread_summary(messages):
+            received.append(text)
+            await asyncio.sleep(0.01) # Consumidor lento (gravação no Notion)
+            assert limiter.active == 0
+        assert received == ["Um ", "resumo"]
+        assert cached == ["Um resumo"]
+    asyncio.run(scenario())
+
+
+def test_streamed_summary_error_reaches_the_consumer_after_the_received_text(streaming, monkeypatch):
+    limiter, messages, cached = streaming
+    monkeypatch.setattr(ia_processor, "_model", FakeStreamingModel(["Um "], error=ValueError("falhou")))
+
+    async def scenario():
+        received = []
+        with pytest.raises(ValueError):
+            async for text in ia_processor.stream_thread_summary(messages):
+                received.append(text)
+        assert received == ["Um "]
+        assert cached == [] and limiter.active == 0
+    asyncio.run(scenario())
+
+
+def test_condense_stops_after_max_reduce_rounds_and_truncates(monkeypatch):
+    monkeypatch.setattr(ia_processor, "SUMMARY_CHUNK_TOKENS", 100)
+    calls = []
+
+    async def generate(prompt):
+        calls.append(prompt)
+        return "§" * 300 # O modelo não encurta o texto
+    monkeypatch.setattr(ia_processor, "_generate", generate)
+    lines = [f"{'y' * 300}\n" for _ in range(8)]
+    prompt = asyncio.run(ia_processor._condense(lines))
+    assert len(calls) == 8 * ia_processor.SUMMARY_MAX_REDUCE_ROUNDS
+    assert prompt.count("§") <= 100 * ia_processor.CHARS_PER_TOKEN
+
+
+def test_condense_merges_when_partial_summaries_fit(monkeypatch):
+    monkeypatch.setattr(ia_processor, "SUMMARY_CHUNK_TOKENS", 100)
+
+    async def generate(prompt):
+        return "resumo"
+    monkeypatch.setattr(ia_processor, "_generate", generate)
+    prompt = asyncio.run(ia_processor._condense([f"{'y' * 300}\n" for _ in range(3)]))
+    assert "Parte 3:\nresumo" in prompt
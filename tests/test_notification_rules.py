@@ -0,0 +1,102 @@
+from config_utils import ConfigStore
+from notification_rules import RuleEngine, render_template
+from notion_integration import NotionFormatting
+from page_snapshots import PageSnapshotStore
+
+DATABASE_ID = "0123456789abcdef0123456789abcdef"
+OTHER_DATABASE_ID = "fedcba9876543210fedcba9876543210"
+
+
+def rule(prop_name: str, value: str, action: str = "topic") -> dict:
+    return {"trigger_property_name": prop_name, "trigger_value_name": value, "action_type": action}
+
+
+def make_store(tmp_path) -> ConfigStore:
+    store = ConfigStore(str(tmp_path / "configs.json"), flush_delay=60)
+    store.update("guild", "channel-a", {"notion_url": f"https://www.notion.so/{DATABASE_ID}",
+                                        "notification_rules": [rule("Status", "Concluído"), rule("Tags", "Urgente")]})
+    store.update("guild", "channel-b", {"notion_url": f"https://www.notion.so/{DATABASE_ID}",
+                                        "notification_rules": [rule("Status", "concluído ", action="channel")]})
+    return store
+
+
+def page(status: str, tags: list[str]) -> dict:
+    return {"properties": {
+        "Status": {"type": "status", "status": {"name": status}},
+        "Tags": {"type": "multi_select", "multi_select": [{"name": tag} for tag in tags]},
+        "Nome": {"type": "title", "title": [{"plain_text": "Card"}]}}}
+
+
+# --- RuleEngine ---
+
+def test_rules_are_indexed_by_database_and_trigger_property(tmp_path):
+    engine = RuleEngine(make_store(tmp_path))
+    assert sorted(engine.trigger_properties(DATABASE_ID)) == ["Status", "Tags"]
+    assert engine.trigger_properties(OTHER_DATABASE_ID) == []
+
+
+def test_watched_values_cover_only_trigger_properties(tmp_path):
+    engine = RuleEngine(make_store(tmp_path))
+    values = engine.watched_values(DATABASE_ID, page("Concluído", ["Urgente", "Bug"]), NotionFormatting())
+    assert values == {"Status": ["Concluído"], "Tags": ["Urgente", "Bug"]}
+
+
+def test_match_values_ignores_case_and_spacing(tmp_path):
+    engine = RuleEngine(make_store(tmp_path))
+    matches = engine.match_values(DATABASE_ID, {"Status": ["CONCLUÍDO"], "Tags": ["Bug"]})
+    assert sorted((config["channel_id"], trigger_value) for _, config, trigger_value in matches) == [
+        ("channel-a", "CONCLUÍDO"), ("channel-b", "CONCLUÍDO")]
+
+
+def test_index_is_rebuilt_when_a_config_changes(tmp_path):
+    store = make_store(tmp_path)
+    engine = RuleEngine(store)
+    assert engine.match_values(DATABASE_ID, {"Prioridade": ["Alta"]}) == []
+    store.update("guild", "channel-a", {"notification_rules": [rule("Prioridade", "Alta")]})
+    assert [r["trigger_value_name"] for r, _, _ in engine.match_values(DATABASE_ID, {"Prioridade": ["Alta"]})] == ["Alta"]
+    assert "Tags" not in engine.trigger_properties(DATABASE_ID)
+
+
+def test_render_template_keeps_unknown_placeholders():
+    assert render_template("{card_title} -> {trigger_value} {outro}", "Card", "Feito") == "Card -> Feito {outro}"
+    assert render_template("{card_title} {", "Card", "Feito") == "Card {"
+
+
+# --- PageSnapshotStore ---
+
+def make_snapshots(tmp_path, max_pages: int = 100) -> PageSnapshotStore:
+    return PageSnapshotStore(str(tmp_path / "page_snapshots.json"), max_pages=max_pages, flush_delay=60)
+
+
+def test_first_sighting_only_counts_properties_the_event_changed(tmp_path):
+    snapshots = make_snapshots(tmp_path)
+    values = {"Status": ["Concluído"], "Tags": ["Urgente"]}
+    assert snapshots.diff("page-1", values) == {}
+    assert snapshots.diff("page-2", values, changed_properties={"Status"}) == {"Status": ["Concluído"]}
+
+
+def test_only_values_that_became_present_are_transitions(tmp_path):
+    snapshots = make_snapshots(tmp_path)
+    snapshots.diff("page", {"Status": ["A fazer"], "Tags": ["Bug"]}, changed_properties={"Status", "Tags"})
+    # Edição que não toca nas propriedades observadas
+    assert snapshots.diff("page", {"Status": ["A fazer"], "Tags": ["Bug"]}) == {}
+    assert snapshots.diff("page", {"Status": ["Concluído"], "Tags": ["Bug", "Urgente"]}) == {
+        "Status": ["Concluído"], "Tags": ["Urgente"]}
+    # Comparação normalizada: a mesma opção com outra grafia não é uma transição
+    assert snapshots.diff("page", {"Status": ["concluído"], "Tags": ["Urgente"]}) == {}
+
+
+def test_snapshot_keeps_properties_no_longer_watched(tmp_path):
+    snapshots = make_snapshots(tmp_path)
+    snapshots.diff("page", {"Status": ["Concluído"], "Tags": ["Bug"]}, changed_properties={"Status", "Tags"})
+    snapshots.diff("page", {"Status": ["Concluído"]})
+    assert snapshots.diff("page", {"Status": ["Concluído"], "Tags": ["Bug"]}) == {}
+
+
+def test_removed_and_least_recent_pages_are_forgotten(tmp_path):
+    snapshots = make_snapshots(tmp_path, max_pages=2)
+    for page_id in ("a", "b", "c"):
+        snapshots.diff(page_id, {"Status": ["Feito"]}, changed_properties={"Status"})
+    assert snapshots.get("a") is None
+    snapshots.remove("b")
+    assert snapshots.get("b") is None and snapshots.get("c") is not None
@@ -0,0 +1,163 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import notion_integration
+from notion_integration import MAX_BLOCKS_PER_REQUEST, AsyncNotionIntegration, NotionAPIError
+
+
+class FakeBlockChildren:
+    """
+    blocks.children do Notion em memória. failures é uma lista de ações para as próximas
+    chamadas de append: None (sucesso), 'before' (falha sem gravar), 'after' (grava e
+    falha, como um timeout com a resposta perdida) ou um número (grava só esse tanto e falha).
+    """
+    def __init__(self, existing: list[str] | None = None):
+        self._ids = itertools.count()
+        self.children = [(f"existing-{i}", name) for i, name in enumerate(existing or [])]
+        self.failures: list = []
+        self.append_calls: list[int] = []
+
+    def names(self) -> list[str]:
+        return [name for _, name in self.children]
+
+    async def list(self, block_id: str, page_size: int = 100, start_cursor: str | None = None):
+        start = int(start_cursor or 0)
+        page = self.children[start:start + page_size]
+        has_more = start + page_size < len(self.children)
+        return {"results": [{"id": block_id} for block_id, _ in page], "has_more": has_more,
+                "next_cursor": str(start + page_size) if has_more else None}
+
+    async def append(self, block_id: str, children, after: str | None = None):
+        self.append_calls.append(len(children))
+        action = self.failures.pop(0) if self.failures else None
+        if action == 'before':
+            raise TimeoutError("falha antes de gravar")
+        written = children if action in (None, 'after') else children[:action]
+        new = [(f"block-{next(self._ids)}", block['paragraph']['rich_text'][0]['text']['content']) for block in written]
+        position = len(self.children) if after is None else [bid for bid, _ in self.children].index(after) + 1
+        self.children[position:position] = new
+        if action is not None:
+            raise TimeoutError("falha depois de gravar")
+        return {"results": [{"id": bid} for bid, _ in self.children]}
+
+
+def paragraphs(count: int, prefix: str = "p") -> list[dict]:
+    return [{"object": "block", "type": "paragraph",
+             "paragraph": {"rich_text": [{"type": "text", "text": {"content": f"{prefix}{i}"}}]}}
+            for i in range(count)]
+
+
+@pytest.fixture
+def notion(monkeypatch):
+    monkeypatch.setenv("NOTION_TOKEN", "secret_test")
+    integration = AsyncNotionIntegration()
+    integration.notion = SimpleNamespace(blocks=SimpleNamespace(children=FakeBlockChildren()))
+    return integration
+
+
+def children_api(notion) -> FakeBlockChildren:
+    return notion.notion.blocks.children
+
+
+def test_blocks_are_sent_in_ordered_batches_of_100(notion):
+    blocks = paragraphs(250)
+    last_id = asyncio.run(notion.append_blocks("page", blocks))
+    api = children_api(notion)
+    assert api.append_calls == [MAX_BLOCKS_PER_REQUEST, MAX_BLOCKS_PER_REQUEST, 50]
+    assert api.names() == [f"p{i}" for i in range(250)]
+    assert last_id == api.children[-1][0]
+
+
+@pytest.mark.parametrize("failure", ['before', 'after', 30])
+def test_failed_batch_is_completed_without_duplicates(notion, failure):
+    api = children_api(notion)
+    api.failures = [None, failure]
+    asyncio.run(notion.append_blocks("page", paragraphs(250)))
+    assert api.names() == [f"p{i}" for i in range(250)]
+
+
+def test_retry_after_partial_write_resends_only_the_missing_blocks(notion):
+    api = children_api(notion)
+    api.failures = [30]
+    asyncio.run(notion.append_blocks("page", paragraphs(100)))
+    assert api.append_calls == [100, 70]
+
+
+def test_blocks_after_an_anchor_keep_their_order_across_failures(notion):
+    api = FakeBlockChildren(existing=["heading", "attachments"])
+    notion.notion.blocks.children = api
+    api.failures = [None, 'after']
+    last_id = asyncio.run(notion.append_blocks("page", paragraphs(150), after=api.children[0][0]))
+    assert api.names() == ["heading", *[f"p{i}" for i in range(150)], "attachments"]
+    assert last_id == api.children[-2][0]
+
+
+def test_gives_up_after_max_attempts(notion):
+    api = children_api(notion)
+    api.failures = ['before'] * 3
+    with pytest.raises(NotionAPIError):
+        asyncio.run(notion.append_blocks("page", paragraphs(10), max_attempts=3))
+    assert api.names() == []
+
+
+def test_existing_children_are_not_counted_as_written(notion):
+    api = FakeBlockChildren(existing=["a", "b", "c"])
+    notion.notion.blocks.children = api
+    api.failures = ['after']
+    asyncio.run(notion.append_blocks("page", paragraphs(5)))
+    assert api.names() == ["a", "b", "c", "p0", "p1", "p2", "p3", "p4"]
+
+
+def discord_user(user_id: int, name: str) -> discord.User:
+    return discord.User(state=None, data={"id": user_id, "username": name, "discriminator": "0",
+                                          "global_name": None, "avatar": None})
+
+
+def test_people_list_skips_members_that_fail_to_resolve(notion, monkeypatch):
+    ok, failing = discord_user(1, "ok"), discord_user(2, "failing")
+
+    async def resolve_member(member):
+        if member is failing:
+            raise NotionAPIError("diretório indisponível")
+        return "notion-user"
+    monkeypatch.setattr(notion, "resolve_member", resolve_member)
+    value = asyncio.run(notion._format_property_value("people", [failing, ok, "notion-id"]))
+    assert value == {"people": [{"id": "notion-user"}, {"id": "notion-id"}]}
+
+
+class FakeDatabases:
+    """databases.query paginado: total páginas de 100 resultados, com um pequeno atraso."""
+    def __init__(self, total_pages: int, delay: float = 0.005):
+        self.total_pages, self.delay = total_pages, delay
+
+    async def query(self, database_id: str, page_size: int, filter_properties=None, start_cursor=None):
+        await asyncio.sleep(self.delay)
+        index = int(start_cursor or 0) + 1
+        has_more = index < self.total_pages
+        return {"results": [{}] * page_size, "has_more": has_more, "next_cursor": str(index) if has_more else None}
+
+
+def test_count_progress_is_throttled_and_does_not_block_the_count(notion, monkeypatch):
+    monkeypatch.setattr(notion_integration, "COUNT_PROGRESS_INTERVAL", 0.02)
+    notion.notion = SimpleNamespace(databases=FakeDatabases(total_pages=40))
+    reports, finished = [], []
+
+    async def slow_progress(count):
+        reports.append(count)
+        await asyncio.sleep(0.1) # Edição lenta no Discord
+        finished.append(count)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        count = await notion.get_database_count(f"https://www.notion.so/{'a' * 32}", progress_callback=slow_progress)
+        assert count == 4000
+        # 40 páginas de ~5 ms: a contagem não espera pelas edições de 100 ms
+        assert loop.time() - started_at < 0.35
+    asyncio.run(scenario())
+    assert 1 <= len(reports) <= 3
+    assert finished == reports # A última atualização termina antes do resultado final
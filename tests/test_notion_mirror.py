@@ -0,0 +1,45 @@
+import asyncio
+
+import notion_mirror
+from config_utils import ConfigStore
+from notion_mirror import NotionMirror
+
+DATABASE_ID = "0123456789abcdef0123456789abcdef"
+
+
+def card(page_id: str, title: str) -> dict:
+    return {"id": page_id, "last_edited_time": "2026-01-01T00:00:00.000Z",
+            "properties": {"Nome": {"type": "title", "title": [{"plain_text": title}]}}}
+
+
+def enable_mirror(tmp_path, monkeypatch, enabled: bool) -> ConfigStore:
+    store = ConfigStore(str(tmp_path / "configs.json"), flush_delay=60)
+    store.update(1, 10, {"notion_url": f"https://www.notion.so/{DATABASE_ID}", "local_mirror_enabled": enabled})
+    monkeypatch.setattr(notion_mirror, "config_store", store)
+    return store
+
+
+def test_database_file_is_not_created_while_the_mirror_is_disabled(tmp_path, monkeypatch):
+    enable_mirror(tmp_path, monkeypatch, enabled=False)
+    path = tmp_path / "notion_mirror.db"
+    mirror = NotionMirror(str(path))
+    mirror.refresh_enabled_databases()
+    assert not mirror.is_ready(DATABASE_ID)
+    mirror.close()
+    assert not path.exists()
+
+
+def test_sync_state_is_loaded_on_first_use_after_a_restart(tmp_path, monkeypatch):
+    enable_mirror(tmp_path, monkeypatch, enabled=True)
+    path = str(tmp_path / "notion_mirror.db")
+    mirror = NotionMirror(path)
+    asyncio.run(mirror.upsert_page(DATABASE_ID, card("page-1", "Corrigir login")))
+    mirror._mark_synced_sync(DATABASE_ID, "2026-01-01T00:00:00+00:00")
+    mirror.close()
+
+    restarted = NotionMirror(path)
+    restarted.refresh_enabled_databases()
+    assert restarted.is_ready(DATABASE_ID)
+    response = asyncio.run(restarted.search(DATABASE_ID, "Nome", "title", "login"))
+    assert [page["id"] for page in response["results"]] == ["page-1"]
+    restarted.close()
@@ -0,0 +1,163 @@
+import asyncio
+
+import httpx
+import pytest
+from notion_client.errors import HTTPResponseError
+
+import notion_scheduler
+from notion_scheduler import (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, NotionRequestScheduler,
+                              SingleFlight, background_priority, request_priority)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_sleep(monkeypatch):
+    """As esperas de backoff viram zero, para os testes não dependerem do relógio."""
+    monkeypatch.setattr(notion_scheduler.random, "uniform", lambda low, high: 0.0)
+
+
+def http_error(status: int, headers: dict | None = None) -> HTTPResponseError:
+    request = httpx.Request("POST", "https://api.notion.com/v1/pages")
+    return HTTPResponseError(httpx.Response(status, headers=headers, request=request))
+
+
+def failing_then_ok(errors: list):
+    """Função de envio que levanta os erros da lista, em ordem, e depois responde 'ok'."""
+    calls = []
+
+    async def send():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+    return send, calls
+
+
+def test_background_priority_is_scoped_to_the_block():
+    assert request_priority.get() == PRIORITY_INTERACTIVE
+    with background_priority():
+        assert request_priority.get() == PRIORITY_BACKGROUND
+    assert request_priority.get() == PRIORITY_INTERACTIVE
+
+
+def test_interactive_requests_are_served_before_queued_background_ones():
+    async def scenario():
+        scheduler = NotionRequestScheduler(rate=50.0, burst=1)
+        await scheduler.acquire(PRIORITY_BACKGROUND) # Esgota o bucket
+        order = []
+
+        async def request(name: str, priority: int):
+            await scheduler.acquire(priority)
+            order.append(name)
+
+        background = [asyncio.create_task(request(f"bg{i}", PRIORITY_BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(request("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.gather(*background, interactive)
+        assert order[0] == "interactive"
+        assert order[1:] == ["bg0", "bg1", "bg2"]
+    asyncio.run(scenario())
+
+
+def test_rate_limited_request_pauses_for_retry_after_and_retries():
+    async def scenario():
+        scheduler = NotionRequestScheduler(rate=100.0, burst=5)
+        send, calls = failing_then_ok([http_error(429, {"Retry-After": "0.05"})])
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        assert await scheduler.run("GET", "pages/abc", send) == "ok"
+        assert len(calls) == 2
+        assert loop.time() - started_at >= 0.05
+        assert scheduler.stats()["throttled"] == 1
+    asyncio.run(scenario())
+
+
+def test_server_errors_are_retried_only_for_idempotent_requests():
+    async def scenario():
+        scheduler = NotionRequestScheduler(rate=100.0, burst=5)
+        send, calls = failing_then_ok([http_error(502)])
+        assert await scheduler.run("POST", "databases/abc/query", send) == "ok"
+        assert len(calls) == 2
+
+        # Criar uma página não é idempotente: repetir poderia duplicar o card
+        send, calls = failing_then_ok([http_error(502)])
+        with pytest.raises(HTTPResponseError):
+            await scheduler.run("POST", "pages", send)
+        assert len(calls) == 1
+    asyncio.run(scenario())
+
+
+def test_client_errors_are_not_retried():
+    async def scenario():
+        scheduler = NotionRequestScheduler(rate=100.0, burst=5)
+        send, calls = failing_then_ok([http_error(400)])
+        with pytest.raises(HTTPResponseError):
+            await scheduler.run("GET", "pages/abc", send)
+        assert len(calls) == 1
+    asyncio.run(scenario())
+
+
+def test_retries_stop_after_max_retries():
+    async def scenario():
+        scheduler = NotionRequestScheduler(rate=100.0, burst=5, max_retries=2)
+        send, calls = failing_then_ok([http_error(503) for _ in range(5)])
+        with pytest.raises(HTTPResponseError):
+            await scheduler.run("GET", "pages/abc", send)
+        assert len(calls) == 3
+    asyncio.run(scenario())
+
+
+def test_appending_blocks_is_not_idempotent():
+    assert notion_scheduler._is_idempotent("PATCH", "pages/abc")
+    assert not notion_scheduler._is_idempotent("PATCH", "blocks/abc/children")
+
+
+# --- SingleFlight ---
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    async def scenario():
+        single_flight, calls = SingleFlight(), []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"id": "abc"}
+
+        results = await asyncio.gather(*[single_flight.do("key", call) for _ in range(5)])
+        assert results == [{"id": "abc"}] * 5
+        assert len(calls) == 1
+        assert single_flight.stats() == {"in_flight": 0, "shared": 4}
+        # Terminada a chamada, nada fica guardado
+        await single_flight.do("key", call)
+        assert len(calls) == 2
+    asyncio.run(scenario())
+
+
+def test_single_flight_shares_the_exception():
+    async def scenario():
+        single_flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("falhou")
+
+        results = await asyncio.gather(*[single_flight.do("key", call) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+    asyncio.run(scenario())
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    async def scenario():
+        single_flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        first = asyncio.create_task(single_flight.do("key", call))
+        second = asyncio.create_task(single_flight.do("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "ok"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+    asyncio.run(scenario())
@@ -0,0 +1,29 @@
+from summary_cache import SummaryCache
+
+
+def make_cache(tmp_path, max_entries: int = 10) -> SummaryCache:
+    return SummaryCache(str(tmp_path / "summary_cache.json"), max_entries=max_entries, flush_delay=60)
+
+
+def test_hit_does_not_schedule_a_write(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set(1, "transcrição", "resumo")
+    cache.flush()
+    assert cache.get(1, "transcrição") == "resumo"
+    assert not cache._dirty
+    assert cache.get(1, "outra transcrição") is None
+
+
+def test_hits_keep_entries_from_being_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.set(1, "a", "resumo a")
+    cache.set(2, "b", "resumo b")
+    cache.get(1, "a") # 1 passa a ser o mais recente
+    cache.set(3, "c", "resumo c")
+    assert cache.get_entry(1) is not None
+    assert cache.get_entry(2) is None
+    # A ordem de uso vai para o disco com a gravação seguinte
+    cache.flush()
+    reloaded = make_cache(tmp_path, max_entries=2)
+    reloaded.set(4, "d", "resumo d")
+    assert reloaded.get_entry(1) is None and reloaded.get_entry(3) is not None
@@ -0,0 +1,205 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import webhook_server
+from config_utils import ConfigStore
+from notification_rules import RuleEngine
+from notion_cache import DatabaseCountCache, extract_database_id
+from notion_integration import NotionFormatting
+from page_snapshots import PageSnapshotStore
+from webhook_server import RecentEventIds, WebhookServer, merge_page_events
+
+DATABASE_ID = "0123456789abcdef0123456789abcdef"
+
+
+class FakeRequest:
+    def __init__(self, data: dict):
+        self._data = data
+
+    async def json(self):
+        return self._data
+
+
+def page_event(event_id: str, page_id: str, event_type: str = "page.properties_updated",
+               updated_properties=None) -> dict:
+    data = {"parent": {"id": DATABASE_ID, "type": "database"}}
+    if updated_properties is not None:
+        data["updated_properties"] = updated_properties
+    return {"id": event_id, "type": event_type, "entity": {"id": page_id, "type": "page"}, "data": data}
+
+
+def make_server(queue_size: int = 10, debounce_seconds: float = 0.0) -> WebhookServer:
+    notion = SimpleNamespace(count_cache=DatabaseCountCache(), extract_database_id=extract_database_id)
+    return WebhookServer(bot=None, notion_integration=notion, queue_size=queue_size, workers=1,
+                         debounce_seconds=debounce_seconds)
+
+
+async def post(server: WebhookServer, data: dict) -> int:
+    response = await server.handle_notion_webhook(FakeRequest(data))
+    return response.status
+
+
+def queued_events(server: WebhookServer) -> list[dict]:
+    events = []
+    while not server.queue.empty():
+        events.append(server.queue.get_nowait()[1])
+    return events
+
+
+# --- RecentEventIds ---
+
+def test_recent_event_ids_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(webhook_server.time, "monotonic", lambda: now[0])
+    recent = RecentEventIds(ttl=10.0)
+    recent.add("a")
+    assert "a" in recent
+    now[0] += 10.0
+    assert "a" not in recent
+
+
+def test_recent_event_ids_drop_oldest_above_max_size():
+    recent = RecentEventIds(max_size=2)
+    for event_id in ("a", "b", "c"):
+        recent.add(event_id)
+    assert "a" not in recent
+    assert "b" in recent and "c" in recent
+
+
+# --- merge_page_events ---
+
+def test_merge_page_events_keeps_latest_and_unions_changed_properties():
+    previous = page_event("1", "page", updated_properties=["a", "b"])
+    latest = page_event("2", "page", updated_properties=["b", "c"])
+    merged = merge_page_events(previous, latest)
+    assert merged["id"] == "2"
+    assert merged["data"]["updated_properties"] == ["a", "b", "c"]
+    # Os eventos originais não são alterados
+    assert latest["data"]["updated_properties"] == ["b", "c"]
+
+
+# --- Deduplicação ---
+
+def test_duplicate_event_is_acknowledged_but_not_queued():
+    async def scenario():
+        server = make_server()
+        assert await post(server, page_event("evt-1", "page-1")) == 200
+        assert await post(server, page_event("evt-1", "page-1")) == 200
+        assert len(queued_events(server)) == 1
+        assert server.metrics.duplicates == 1
+    asyncio.run(scenario())
+
+
+# --- Janela de agrupamento (debounce) ---
+
+def test_burst_for_one_page_is_coalesced_into_a_single_event():
+    async def scenario():
+        server = make_server(debounce_seconds=0.05)
+        await post(server, page_event("evt-1", "page-1", updated_properties=["a"]))
+        await post(server, page_event("evt-2", "page-1", updated_properties=["b"]))
+        await post(server, page_event("evt-3", "page-2", updated_properties=["c"]))
+        assert server.queue.empty()
+        await asyncio.sleep(0.1)
+        events = {event["entity"]["id"]: event for event in queued_events(server)}
+        assert set(events) == {"page-1", "page-2"}
+        assert events["page-1"]["id"] == "evt-2"
+        assert events["page-1"]["data"]["updated_properties"] == ["a", "b"]
+        assert server.metrics.coalesced == 1
+    asyncio.run(scenario())
+
+
+# --- Capacidade da fila ---
+
+def test_full_queue_rejects_without_recording_the_event_id():
+    async def scenario():
+        server = make_server(queue_size=1)
+        assert await post(server, page_event("evt-1", "page-1")) == 200
+        assert await post(server, page_event("evt-2", "page-2")) == 503
+        assert "evt-2" not in server.recent_event_ids
+        # Depois que a fila esvazia, o reenvio do Notion é aceito (não é tratado como duplicado)
+        queued_events(server)
+        assert await post(server, page_event("evt-2", "page-2")) == 200
+    asyncio.run(scenario())
+
+
+def test_pending_pages_reserve_queue_slots_and_are_never_dropped():
+    async def scenario():
+        server = make_server(queue_size=3, debounce_seconds=0.05)
+        statuses = [await post(server, page_event(f"evt-{i}", f"page-{i}")) for i in range(5)]
+        assert statuses == [200, 200, 200, 503, 503]
+        # Eventos de páginas já na janela são mesclados mesmo com a fila cheia
+        assert await post(server, page_event("evt-extra", "page-0")) == 200
+        await asyncio.sleep(0.1)
+        events = queued_events(server)
+        assert sorted(event["entity"]["id"] for event in events) == ["page-0", "page-1", "page-2"]
+        assert server.metrics.rejected == 2
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("event_type, delta", [("page.created", 1), ("page.deleted", -1)])
+def test_accepted_page_events_adjust_the_cached_count(event_type, delta):
+    async def scenario():
+        server = make_server()
+        server.notion.count_cache.set(DATABASE_ID, 10)
+        await post(server, page_event("evt-1", "page-1", event_type=event_type))
+        assert server.notion.count_cache.get(DATABASE_ID) == 10 + delta
+    asyncio.run(scenario())
+
+
+# --- Regras de notificação com eventos mesclados ---
+
+class FakeNotion(NotionFormatting):
+    """Notion em memória: uma página com Status 'Done' definido na criação."""
+    mirror = None
+
+    def __init__(self):
+        self.count_cache = DatabaseCountCache()
+        self.page = {"id": "page-1", "properties": {
+            "Name": {"id": "title", "type": "title", "title": [{"plain_text": "Card"}]},
+            "Status": {"id": "st%3A1", "type": "status", "status": {"name": "Done"}}}}
+
+    async def get_page(self, page_id: str) -> dict:
+        return self.page
+
+    async def get_database_properties(self, database_id: str) -> dict:
+        return {name: {"id": prop["id"], "type": prop["type"]} for name, prop in self.page["properties"].items()}
+
+
+def make_rule_server(tmp_path, monkeypatch) -> tuple[WebhookServer, list]:
+    store = ConfigStore(str(tmp_path / "configs.json"))
+    store.update("guild", "channel", {
+        "notion_url": f"https://www.notion.so/{DATABASE_ID}",
+        "notification_rules": [{"trigger_property_name": "Status", "trigger_value_name": "Done"}]})
+    monkeypatch.setattr(webhook_server, "config_store", store)
+    server = WebhookServer(bot=None, notion_integration=FakeNotion(), workers=1, debounce_seconds=0.05)
+    server.rule_engine = RuleEngine(store)
+    server.page_snapshots = PageSnapshotStore(str(tmp_path / "page_snapshots.json"))
+    fired = []
+
+    async def dispatch_rule(rule, config, page_details, trigger_value):
+        fired.append(trigger_value)
+    server.dispatch_rule = dispatch_rule
+    return server, fired
+
+
+def test_merge_keeps_page_created_unless_the_page_was_deleted():
+    created = page_event("1", "page", event_type="page.created")
+    assert merge_page_events(created, page_event("2", "page"))["type"] == "page.created"
+    assert merge_page_events(created, page_event("3", "page", event_type="page.deleted"))["type"] == "page.deleted"
+
+
+@pytest.mark.parametrize("follow_up", [[], [["title"]]])
+def test_rules_fire_for_values_set_at_creation(tmp_path, monkeypatch, follow_up):
+    async def scenario():
+        server, fired = make_rule_server(tmp_path, monkeypatch)
+        await post(server, page_event("evt-1", "page-1", event_type="page.created"))
+        # Edição do título na mesma janela de agrupamento
+        for i, updated in enumerate(follow_up):
+            await post(server, page_event(f"evt-{i + 2}", "page-1", updated_properties=updated))
+        await asyncio.sleep(0.1)
+        [event] = queued_events(server)
+        await server.process_notification(event)
+        assert fired == ["Done"]
+    asyncio.run(scenario())
@@ -0,0 +1,82 @@
+# thread_snapshot.py
+
+import os
+import time
+from typing import List, Dict, Optional
+
+import discord
+
+SNAPSHOT_TTL = float(os.getenv("THREAD_SNAPSHOT_TTL", "60"))
+# Máximo de mensagens lidas por tópico quando o canal não define 'thread_history_limit'
+# (que pode aumentá-lo). Tópicos além do orçamento de tokens são resumidos em partes
+# (map-reduce); 0 lê o histórico completo.
+THREAD_HISTORY_LIMIT = int(os.getenv("THREAD_HISTORY_LIMIT", "1000")) or None
+
+
+def history_limit(config: dict) -> Optional[int]:
+    """Limite de mensagens do histórico para o canal ('thread_history_limit' ou THREAD_HISTORY_LIMIT)."""
+    return config.get('thread_history_limit') or THREAD_HISTORY_LIMIT
+
+
+class ThreadSnapshot:
+    """
+    Histórico de um tópico lido uma única vez, do qual são derivados os
+    participantes, os anexos e as mensagens usadas no resumo da IA.
+    """
+    def __init__(self, thread_id: int, messages: List[discord.Message], limit: Optional[int]):
+        self.thread_id = thread_id
+        self.messages = messages # Da mais nova para a mais antiga, como em thread.history()
+        self.limit = limit
+        self.fetched_at = time.monotonic()
+        self._participants = None
+        self._attachments = None
+
+    def covers(self, limit: Optional[int]) -> bool:
+        """Indica se este snapshot já contém o histórico pedido com o limite informado."""
+        if self.limit is None or len(self.messages) < self.limit:
+            return True # O histórico completo já foi lido
+        return limit is not None and limit <= self.limit
+
+    @property
+    def participants(self) -> set[discord.Member]:
+        if self._participants is None:
+            self._participants = {message.author for message in self.messages if not message.author.bot}
+        return self._participants
+
+    @property
+    def attachments(self) -> List[Dict[str, str]]:
+        if self._attachments is None:
+            self._attachments = []
+            for message in self.messages:
+                for attachment in message.attachments:
+                    if (attachment.content_type or '').startswith(
+                        ('image/', 'video/')) or attachment.filename.lower().endswith(('.gif')):
+                        self._attachments.append({
+                            "type": (attachment.content_type or 'image/gif').split('/')[0],
+                            "url": attachment.url,
+                            "filename": attachment.filename
+                        })
+        return self._attachments
+
+
+_snapshots: Dict[int, ThreadSnapshot] = {}
+
+
+async def get_thread_snapshot(thread: discord.Thread, limit: Optional[int] = 100) -> ThreadSnapshot:
+    """
+    Lê o histórico do tópico em uma única passada (limit=None lê tudo, paginando além de 100).
+    O resultado fica em cache por alguns segundos, para que chamadas repetidas
+    (ex.: vários /card no mesmo tópico) não consultem a API do Discord de novo.
+    """
+    now = time.monotonic()
+    for thread_id in [tid for tid, snap in _snapshots.items() if now - snap.fetched_at >= SNAPSHOT_TTL]:
+        del _snapshots[thread_id]
+
+    snapshot = _snapshots.get(thread.id)
+    if snapshot and snapshot.covers(limit):
+        return snapshot
+
+    messages = [message async for message in thread.history(limit=limit)]
+    snapshot = ThreadSnapshot(thread.id, messages, limit)
+    _snapshots[thread.id] = snapshot
+    return snapshot
@@ -4,14 +4,26 @@ import discord
 from discord import Interaction, SelectOption, ButtonStyle, Color
 from discord.ui import View, Button, Select, Modal, TextInput
 import asyncio
+import logging
+import time
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 import uuid
 
 # Módulos locais
-from notion_integration import NotionIntegration, NotionAPIError
+from notion_integration import AsyncNotionIntegration, NotionAPIError
 from config_utils import save_config, load_config
-from ia_processor import summarize_thread_content
+from summarizers import SUMMARIZERS, get_summarizer
+from thread_snapshot import ThreadSnapshot, get_thread_snapshot, history_limit
+
+# Referências para tarefas em segundo plano (evita que sejam coletadas antes de terminar)
+_background_tasks = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
 
 # --- CLASSES PARA O FLUXO DE REGRAS DE NOTIFICAÇÃO ---
 
@@ -79,7 +91,8 @@ class NotificationRuleWizard(View):
     Assistente passo a passo que agora inclui a seleção do tipo de ação.
     """
     def __init__(self, author_id: int, guild_id: int, channel_id: int,
-                 notion: NotionIntegration, config: dict, parent_view: 'NotificationConfigView'):
+                 notion: AsyncNotionIntegration, config: dict, parent_view: 'NotificationConfigView',
+                 all_props: list):
         super().__init__(timeout=300.0)
         self.author_id = author_id
         self.guild_id = guild_id
@@ -87,7 +100,7 @@ class NotificationRuleWizard(View):
         self.notion = notion
         self.config = config
         self.parent_view = parent_view # Para atualizar a view principal no final
-        self.all_props = self.notion.get_properties_for_interaction(self.config['notion_url'])
+        self.all_props = all_props
         self.rule_data = {'rule_id': str(uuid.uuid4())}
 
         self.show_step1_select_property()
@@ -216,7 +229,7 @@ class NotificationConfigView(View):
     e botões para adicionar ou excluir.
     """
     def __init__(self, guild_id: int, channel_id: int, config: dict,
-                 notion: NotionIntegration, interaction: Interaction):
+                 notion: AsyncNotionIntegration, interaction: Interaction):
         super().__init__(timeout=300.0)
         self.guild_id = guild_id
         self.channel_id = channel_id
@@ -270,13 +283,18 @@ class NotificationConfigView(View):
     @discord.ui.button(label="➕ Adicionar Nova Regra", style=ButtonStyle.success, row=0)
     async def add_rule_button(self, interaction: Interaction, button: Button):
         """Inicia o assistente de criação de regras."""
+        try:
+            all_props = await self.notion.get_properties_for_interaction(self.config['notion_url'])
+        except NotionAPIError as e:
+            return await interaction.response.send_message(f"🔴 Erro ao buscar propriedades: {e}", ephemeral=True)
         wizard_view = NotificationRuleWizard(
             author_id=interaction.user.id,
             guild_id=self.guild_id,
             channel_id=self.channel_id,
             notion=self.notion,
             config=self.config,
-            parent_view=self
+            parent_view=self,
+            all_props=all_props
         )
         await interaction.response.edit_message(
             content="**Assistente de Criação de Regra**\nSiga os passos abaixo.",
@@ -314,119 +332,99 @@ class NotificationConfigView(View):
 # --- FUNÇÕES E CLASSES EXISTENTES ---
 
 
-async def get_topic_participants(thread: discord.Thread,
-                                 limit: int = 100) -> set[discord.Member]:
-    participants = set()
-    async for message in thread.history(limit=limit):
-        if not message.author.bot:
-            participants.add(message.author)
-    return participants
-
-
-async def get_thread_attachments(thread: discord.Thread,
-                                 limit: int = 100) -> List[Dict[str, str]]:
-    attachments_data = []
-    async for message in thread.history(limit=limit):
-        if message.attachments:
-            for attachment in message.attachments:
-                if attachment.content_type.startswith(
-                    ('image/',
-                     'video/')) or attachment.filename.lower().endswith(
-                         ('.gif')):
-                    attachments_data.append({
-                        "type":
-                        attachment.content_type.split('/')[0],
-                        "url":
-                        attachment.url,
-                        "filename":
-                        attachment.filename
-                    })
-    return attachments_data
-
-
-async def _build_notion_page_content(
-        config: dict, thread_context: Optional[discord.Thread],
-        notion_integration: NotionIntegration) -> Optional[List[Dict]]:
-    page_content = []
-    if not thread_context: return None
-    if config.get('ai_summary_enabled'):
-        messages = [msg async for msg in thread_context.history(limit=100)]
-        if messages:
-            summary_text = await summarize_thread_content(messages)
-            if summary_text and not summary_text.startswith("Erro:"):
-                page_content.append({
-                    "object": "block",
-                    "type": "heading_2",
-                    "heading_2": {
-                        "rich_text": [{
-                            "type": "text",
-                            "text": {
-                                "content": "🤖 Resumo da IA"
-                            }
-                        }]
+async def _build_summary_blocks(config: dict, snapshot: ThreadSnapshot,
+                                notion_integration: AsyncNotionIntegration) -> List[Dict]:
+    """Blocos com o resumo da IA do tópico (lista vazia se desativado ou sem conteúdo)."""
+    summarizer = get_summarizer(config)
+    if not summarizer or not snapshot.messages:
+        return []
+    summary_text = await summarizer.summarize(snapshot.messages)
+    if not summary_text or summary_text.startswith("Erro:"):
+        return []
+    return [_summary_heading_block()] + notion_integration._parse_summary_to_notion_blocks(summary_text)
+
+
+def _summary_heading_block() -> Dict:
+    return {
+        "object": "block",
+        "type": "heading_2",
+        "heading_2": {
+            "rich_text": [{
+                "type": "text",
+                "text": {
+                    "content": "🤖 Resumo da IA"
+                }
+            }]
+        }
+    }
+
+
+def _build_attachment_blocks(attachments: List[Dict[str, str]]) -> List[Dict]:
+    """Blocos com as imagens e os vídeos/GIFs enviados no tópico."""
+    if not attachments:
+        return []
+    blocks = [{
+        "object": "block",
+        "type": "heading_2",
+        "heading_2": {
+            "rich_text": [{
+                "type": "text",
+                "text": {
+                    "content": "📎 Anexos do Tópico"
+                }
+            }]
+        }
+    }]
+    for att in attachments:
+        if att['type'] == 'image':
+            blocks.append({
+                "object": "block",
+                "type": "image",
+                "image": {
+                    "type": "external",
+                    "external": {
+                        "url": att['url']
                     }
-                })
-                parsed_summary_blocks = notion_integration._parse_summary_to_notion_blocks(
-                    summary_text)
-                page_content.extend(parsed_summary_blocks)
-    attachments = await get_thread_attachments(thread_context)
-    if attachments:
-        if page_content:
-            page_content.append({
+                }
+            })
+        elif att['type'] == 'video':
+            blocks.append({
                 "object": "block",
-                "type": "divider",
-                "divider": {}
+                "type": "paragraph",
+                "paragraph": {
+                    "rich_text": [{
+                        "type": "text",
+                        "text": {
+                            "content": f"Vídeo/GIF ({att['filename']}): "
+                        }
+                    }, {
+                        "type": "text",
+                        "text": {
+                            "content": att['url'],
+                            "link": {
+                                "url": att['url']
+                            }
+                        }
+                    }]
+                }
             })
+    return blocks
+
+
+def _compose_page_content(summary_blocks: List[Dict], attachment_blocks: List[Dict]) -> Optional[List[Dict]]:
+    page_content = list(summary_blocks)
+    if summary_blocks and attachment_blocks:
         page_content.append({
             "object": "block",
-            "type": "heading_2",
-            "heading_2": {
-                "rich_text": [{
-                    "type": "text",
-                    "text": {
-                        "content": "📎 Anexos do Tópico"
-                    }
-                }]
-            }
+            "type": "divider",
+            "divider": {}
         })
-        for att in attachments:
-            if att['type'] == 'image':
-                page_content.append({
-                    "object": "block",
-                    "type": "image",
-                    "image": {
-                        "type": "external",
-                        "external": {
-                            "url": att['url']
-                        }
-                    }
-                })
-            elif att['type'] == 'video':
-                page_content.append({
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {
-                        "rich_text": [{
-                            "type": "text",
-                            "text": {
-                                "content": f"Vídeo/GIF ({att['filename']}): "
-                            }
-                        }, {
-                            "type": "text",
-                            "text": {
-                                "content": att['url'],
-                                "link": {
-                                    "url": att['url']
-                                }
-                            }
-                        }]
-                    }
-                })
+    page_content.extend(attachment_blocks)
     return page_content if page_content else None
 
 
 async def start_editing_flow(interaction: Interaction, page_id_to_edit: str,
-                             config: dict, notion: NotionIntegration):
+                             config: dict, notion: AsyncNotionIntegration):
     await interaction.followup.send("A funcionalidade de edição ainda não foi totalmente implementada.", ephemeral=True)
     pass
 
@@ -453,7 +451,7 @@ class SelectView(View):
 class CardActionView(View):
 
     def __init__(self, author_id: int, page_id: str, config: dict,
-                 notion: NotionIntegration):
+                 notion: AsyncNotionIntegration):
         super().__init__(timeout=None)
         self.author_id, self.page_id, self.config, self.notion = author_id, page_id, config, notion
 
@@ -478,7 +476,7 @@ class CardActionView(View):
             confirm_view.stop()
             try:
                 await inter.response.defer(ephemeral=True, thinking=True)
-                self.notion.delete_page(self.page_id)
+                await self.notion.delete_page(self.page_id)
                 for item in self.children:
                     item.disabled = True
                 original_embed = interaction.message.embeds[0]
@@ -505,21 +503,56 @@ class CardActionView(View):
 
 
 class PaginationView(View):
+    """
+    Navega pelos resultados de uma busca. Pode receber uma lista pronta ou um
+    gerador de páginas da API (ver iter_search_pages): nesse caso, a próxima
+    página do Notion só é buscada quando o usuário passa do último card carregado.
+    """
 
     def __init__(self,
                  author: discord.Member,
                  results: list,
                  config: dict,
-                 notion: NotionIntegration,
-                 actions: List[str] = []):
+                 notion: AsyncNotionIntegration,
+                 actions: List[str] = [],
+                 result_pages=None):
         super().__init__(timeout=300.0)
-        self.author, self.results, self.config, self.actions, self.notion = author, results, config, actions, notion
-        self.current_page, self.total_pages = 0, len(results)
+        self.author, self.results, self.config, self.actions, self.notion = author, list(results), config, actions, notion
+        self.result_pages = result_pages
+        self.exhausted = result_pages is None
+        self.current_page, self.total_pages = 0, len(self.results)
         if 'edit' not in self.actions: self.remove_item(self.edit_button)
         if 'delete' not in self.actions: self.remove_item(self.delete_button)
         if 'share' not in self.actions: self.remove_item(self.share_button)
         self.update_nav_buttons()
 
+    @classmethod
+    async def from_result_pages(cls, author: discord.Member, result_pages,
+                                config: dict, notion: AsyncNotionIntegration,
+                                actions: List[str] = []) -> 'PaginationView':
+        """Cria a view buscando apenas a primeira página de resultados do Notion."""
+        view = cls(author, [], config, notion, actions=actions, result_pages=result_pages)
+        await view.load_more()
+        return view
+
+    async def load_more(self):
+        """Busca a próxima página de resultados do Notion, se houver."""
+        if self.exhausted:
+            return
+        try:
+            response = await anext(self.result_pages)
+        except StopAsyncIteration:
+            self.exhausted = True
+        else:
+            self.results.extend(response.get('results', []))
+            self.exhausted = not response.get('has_more')
+        self.total_pages = len(self.results)
+        self.update_nav_buttons()
+
+    @property
+    def total_label(self) -> str:
+        return f"{self.total_pages}" if self.exhausted else f"{self.total_pages}+"
+
     async def interaction_check(self, interaction: Interaction) -> bool:
         if interaction.user.id != self.author.id:
             await interaction.response.send_message(
@@ -530,7 +563,7 @@ class PaginationView(View):
 
     def update_nav_buttons(self):
         self.previous_button.disabled = self.current_page == 0
-        self.next_button.disabled = self.current_page >= self.total_pages - 1
+        self.next_button.disabled = self.current_page >= self.total_pages - 1 and self.exhausted
 
     async def get_page_embed(self) -> discord.Embed:
         page_data = self.results[self.current_page]
@@ -539,7 +572,7 @@ class PaginationView(View):
             display_properties=self.config.get('display_properties', []),
             include_footer=True)
         embed.set_footer(
-            text=f"Card {self.current_page + 1} de {self.total_pages}")
+            text=f"Card {self.current_page + 1} de {self.total_label}")
         return embed
 
     @discord.ui.button(label="⬅️", style=ButtonStyle.secondary, row=0)
@@ -552,8 +585,18 @@ class PaginationView(View):
 
     @discord.ui.button(label="➡️", style=ButtonStyle.secondary, row=0)
     async def next_button(self, interaction: Interaction, button: Button):
+        if self.current_page >= self.total_pages - 1 and not self.exhausted:
+            await interaction.response.defer()
+            try:
+                await self.load_more()
+            except NotionAPIError as e:
+                return await interaction.followup.send(f"🔴 **Erro:**\n`{e}`", ephemeral=True)
         if self.current_page < self.total_pages - 1: self.current_page += 1
         self.update_nav_buttons()
+        if interaction.response.is_done():
+            return await interaction.edit_original_response(embed=await
+                                                            self.get_page_embed(),
+                                                            view=self)
         await interaction.response.edit_message(embed=await
                                                 self.get_page_embed(),
                                                 view=self)
@@ -580,7 +623,7 @@ class PaginationView(View):
         async def yes_callback(inter: Interaction):
             await inter.response.defer(ephemeral=True, thinking=True)
             try:
-                self.notion.delete_page(page_id)
+                await self.notion.delete_page(page_id)
                 await interaction.edit_original_response(
                     content="✅ Card excluído com sucesso.",
                     view=None,
@@ -628,7 +671,7 @@ class PaginationView(View):
 
 class SearchModal(discord.ui.Modal):
 
-    def __init__(self, notion: NotionIntegration, config: dict,
+    def __init__(self, notion: AsyncNotionIntegration, config: dict,
                  selected_property: dict):
         self.notion, self.config, self.selected_property = notion, config, selected_property
         super().__init__(
@@ -640,23 +683,22 @@ class SearchModal(discord.ui.Modal):
     async def on_submit(self, interaction: Interaction):
         await interaction.response.defer(thinking=True, ephemeral=True)
         try:
-            cards = self.notion.search_in_database(
+            result_pages = self.notion.iter_search_pages(
                 self.config['notion_url'], self.search_term_input.value,
                 self.selected_property['name'], self.selected_property['type'])
-            results = cards.get('results', [])
-            if not results:
+            view = await PaginationView.from_result_pages(
+                interaction.user,
+                result_pages,
+                self.config,
+                self.notion,
+                actions=['edit', 'delete', 'share'])
+            if not view.results:
                 return await interaction.followup.send(
                     f"❌ Nenhum resultado para **'{self.search_term_input.value}'**.",
                     ephemeral=True)
             await interaction.followup.send(
-                f"✅ **{len(results)}** resultado(s) encontrado(s)! Veja abaixo:",
+                f"✅ **{view.total_label}** resultado(s) encontrado(s)! Veja abaixo:",
                 ephemeral=True)
-            view = PaginationView(interaction.user,
-                                  results,
-                                  self.config,
-                                  self.notion,
-                                  actions=['edit', 'delete', 'share'])
-            view.update_nav_buttons()
             await interaction.followup.send(embed=await view.get_page_embed(),
                                             view=view,
                                             ephemeral=True)
@@ -668,7 +710,7 @@ class SearchModal(discord.ui.Modal):
 class PublishView(View):
 
     def __init__(self, author_id: int, embed_to_publish: discord.Embed,
-                 page_id: str, config: dict, notion: NotionIntegration):
+                 page_id: str, config: dict, notion: AsyncNotionIntegration):
         super().__init__(timeout=300.0)
         self.author_id, self.embed, self.page_id, self.config, self.notion = author_id, embed_to_publish, page_id, config, notion
 
@@ -700,7 +742,7 @@ class CardSelectPropertiesView(View):
     def __init__(self, author_id: int, config: dict, all_properties: list,
                  select_props: list, collected_from_modal: dict,
                  thread_context: Optional[discord.Thread],
-                 notion: NotionIntegration):
+                 notion: AsyncNotionIntegration):
         super().__init__(timeout=300.0)
         self.author_id = author_id
         self.config = config
@@ -751,87 +793,215 @@ class CardSelectPropertiesView(View):
             item.disabled = True
         await interaction.edit_original_response(content="Processando criação do card...", view=self)
 
+        # A criação roda em segundo plano; o callback da interação retorna imediatamente
+        # e a mensagem efêmera é atualizada a cada etapa concluída.
+        run_in_background(CardCreationJob(interaction, self).run())
+
+
+async def _single_chunk(text: str):
+    yield text
+
+
+class CardCreationJob:
+    """
+    Criação de um card em etapas, fora do callback da interação. Depois da leitura
+    do histórico do tópico, as etapas independentes (pessoas, anexos, resumo da IA
+    e schema da base) rodam em paralelo; a mensagem efêmera mostra o andamento e o
+    tempo de cada etapa.
+
+    Com 'ai_summary_streaming' ativado, o card é criado sem esperar pelo resumo, que
+    é escrito na página em seguida, à medida que o modelo o gera.
+    """
+    STAGE_LABELS = {
+        'history': "📜 Lendo o histórico do tópico",
+        'people': "👥 Identificando pessoas no Notion",
+        'attachments': "📎 Coletando anexos",
+        'summary': "🤖 Gerando resumo da IA",
+        'schema': "🗂️ Lendo as propriedades da base",
+        'create': "📝 Criando o card no Notion",
+    }
+
+    def __init__(self, interaction: Interaction, view: 'CardSelectPropertiesView'):
+        self.interaction = interaction
+        self.view = view
+        self.config = view.config
+        self.notion = view.notion
+        self.thread = view.thread_context
+        self.properties = dict(view.collected_properties)
+        stages = ['history', 'people', 'attachments', 'summary', 'schema', 'create'] if self.thread \
+            else ['people', 'schema', 'create']
+        if not self.config.get('ai_summary_enabled') and 'summary' in stages:
+            stages.remove('summary')
+        self.stream_summary = 'summary' in stages and self.config.get('ai_summary_streaming', False)
+        if self.stream_summary:
+            stages.remove('summary')
+        self.timings: Dict[str, Optional[float]] = {stage: None for stage in stages}
+        self._edit_lock = asyncio.Lock()
+
+    def progress_text(self) -> str:
+        lines = ["**Criando o card...**"]
+        for stage, elapsed in self.timings.items():
+            status = f"✅ ({elapsed:.1f}s)" if elapsed is not None else "⏳"
+            lines.append(f"{status} {self.STAGE_LABELS[stage]}")
+        return "\n".join(lines)
+
+    async def _report(self, content: Optional[str] = None, **kwargs):
+        async with self._edit_lock:
+            try:
+                await self.interaction.edit_original_response(content=content or self.progress_text(), **kwargs)
+            except discord.HTTPException as e:
+                logging.warning(f"Não foi possível atualizar o progresso da criação do card: {e}")
+
+    async def _stage(self, stage: str, coro):
+        started_at = time.monotonic()
+        result = await coro
+        self.timings[stage] = time.monotonic() - started_at
+        await self._report()
+        return result
+
+    async def _resolve_people(self, snapshot: Optional[ThreadSnapshot]) -> Dict[str, List[str]]:
+        """IDs do Notion do autor e dos participantes do tópico, por propriedade de Pessoa."""
+        individual_prop = self.config.get('individual_person_prop')
+        collective_prop = self.config.get('collective_person_prop') if snapshot else None
+        author_id, participant_ids = await asyncio.gather(
+            self.notion.resolve_member(self.interaction.user) if individual_prop else asyncio.sleep(0),
+            self.notion.resolve_members(snapshot.participants) if collective_prop else asyncio.sleep(0))
+        people = {}
+        if individual_prop and author_id:
+            people[individual_prop] = [author_id]
+        if collective_prop and participant_ids:
+            # Junta sem duplicatas, caso autor e participantes usem a mesma propriedade
+            people[collective_prop] = list(set(people.get(collective_prop, [])) | set(participant_ids))
+        return people
+
+    async def _attachment_blocks(self, snapshot: ThreadSnapshot) -> List[Dict]:
+        return _build_attachment_blocks(snapshot.attachments)
+
+    async def _no_blocks(self) -> List[Dict]:
+        return []
+
+    async def _read_schema(self) -> Dict:
+        return await self._stage('schema', self.notion.get_database_properties(self.config['notion_url']))
+
+    async def run(self):
+        started_at = time.monotonic()
         try:
             title_prop_name = next(
-                (p['name'] for p in self.all_properties if p['type'] == 'title'), None)
+                (p['name'] for p in self.view.all_properties if p['type'] == 'title'), None)
             if not title_prop_name:
                 raise NotionAPIError("Nenhuma propriedade de Título foi encontrada na base de dados.")
-            
-            title_value = self.collected_properties.pop(
+            title_value = self.properties.pop(
                 title_prop_name, f"Card criado em {datetime.now().strftime('%d/%m/%Y %H:%M')}")
-
-            # --- INÍCIO DA LÓGICA CORRIGIDA ---
-
-            # Lida com a propriedade de Pessoa Individual (autor do comando)
-            if individual_prop := self.config.get('individual_person_prop'):
-                # Busca o ID do usuário do Notion com base no nome do Discord
-                user_id = self.notion.search_id_person(interaction.user.display_name)
-                if user_id:
-                    # Armazena o ID encontrado em uma lista
-                    self.collected_properties[individual_prop] = [user_id]
-
-            # Lida com a propriedade de Pessoas Coletivas (participantes do tópico)
-            if collective_prop := self.config.get('collective_person_prop'):
-                if self.thread_context:
-                    participants = await get_topic_participants(self.thread_context)
-                    notion_user_ids = []
-                    for member in participants:
-                        # Para cada participante do Discord, busca o ID correspondente no Notion
-                        user_id = self.notion.search_id_person(member.display_name)
-                        if user_id:
-                            notion_user_ids.append(user_id)
-                    
-                    if notion_user_ids:
-                        # Usa um Set para juntar os IDs sem duplicatas, caso a mesma pessoa
-                        # seja o autor e participante, e a propriedade seja a mesma.
-                        existing_ids = set(self.collected_properties.get(collective_prop, []))
-                        new_ids = set(notion_user_ids)
-                        self.collected_properties[collective_prop] = list(existing_ids.union(new_ids))
-            
-            # --- FIM DA LÓGICA CORRIGIDA ---
-
-            if topic_prop_name := self.config.get('topic_link_property_name'):
-                if self.thread_context:
-                    self.collected_properties[topic_prop_name] = self.thread_context.jump_url
-
-            page_content = await _build_notion_page_content(
-                self.config, self.thread_context, self.notion)
-            
-            # Agora esta função receberá uma lista de IDs para as propriedades de Pessoa
-            page_properties = self.notion.build_page_properties(
-                self.config['notion_url'], title_value, self.collected_properties)
-            
-            response = self.notion.insert_into_database(
-                self.config['notion_url'], page_properties, children=page_content)
-            
-            await interaction.edit_original_response(content="✅ Processo concluído.", view=None)
+            await self._report()
+
+            # O schema não depende do histórico: começa junto com a leitura do tópico
+            schema_task = asyncio.ensure_future(self._read_schema())
+            snapshot = None
+            if self.thread:
+                try:
+                    snapshot = await self._stage('history', get_thread_snapshot(
+                        self.thread, history_limit(self.config)))
+                except Exception:
+                    # Não deixa a leitura do schema solta (requisição pendente e erro nunca lido)
+                    schema_task.cancel()
+                    await asyncio.gather(schema_task, return_exceptions=True)
+                    raise
+
+            people, attachment_blocks, summary_blocks, _ = await asyncio.gather(
+                self._stage('people', self._resolve_people(snapshot)),
+                self._stage('attachments', self._attachment_blocks(snapshot)) if snapshot else self._no_blocks(),
+                self._stage('summary', _build_summary_blocks(self.config, snapshot, self.notion))
+                if 'summary' in self.timings else self._no_blocks(),
+                schema_task)
+
+            for prop_name, user_ids in people.items():
+                existing_ids = self.properties.get(prop_name, [])
+                existing_ids = existing_ids if isinstance(existing_ids, list) else [existing_ids]
+                self.properties[prop_name] = list(set(existing_ids) | set(user_ids))
+            if self.thread and (topic_prop_name := self.config.get('topic_link_property_name')):
+                self.properties[topic_prop_name] = self.thread.jump_url
+
+            if self.stream_summary:
+                # Só o título da seção entra agora; o resumo é escrito logo abaixo dele depois
+                summary_blocks = [_summary_heading_block()]
+
+            async def create_page():
+                # O schema já está em cache, lido na etapa anterior
+                page_properties = await self.notion.build_page_properties(
+                    self.config['notion_url'], title_value, self.properties)
+                return await self.notion.insert_into_database(
+                    self.config['notion_url'], page_properties,
+                    children=_compose_page_content(summary_blocks, attachment_blocks))
+            response = await self._stage('create', create_page())
+
+            total = time.monotonic() - started_at
+            logging.info("Card criado em %.1fs (%s).", total,
+                         ", ".join(f"{stage}={elapsed:.1f}s" for stage, elapsed in self.timings.items()))
+            if self.stream_summary:
+                await self._report(f"✅ Card criado em {total:.1f}s. ✍️ Escrevendo o resumo da IA na página...", view=None)
+            else:
+                await self._report(f"✅ Processo concluído em {total:.1f}s.", view=None)
 
             success_embed = self.notion.format_page_for_embed(
                 response, display_properties=self.config.get('display_properties', []))
-            
             if not success_embed:
-                return await interaction.followup.send("❌ Card criado, mas não foi possível formatar o embed de confirmação.", ephemeral=True)
+                return await self.interaction.followup.send("❌ Card criado, mas não foi possível formatar o embed de confirmação.", ephemeral=True)
 
             success_embed.title = f"✅ Card '{success_embed.title.replace('📌 ', '')}' Criado!"
             success_embed.color = Color.purple()
-            publish_view = PublishView(interaction.user.id, success_embed, response['id'], self.config, self.notion)
-            
-            await interaction.followup.send(
+            publish_view = PublishView(self.interaction.user.id, success_embed, response['id'], self.config, self.notion)
+            await self.interaction.followup.send(
                 "Use o botão abaixo para exibir seu card para todos.",
                 embed=success_embed,
                 view=publish_view,
                 ephemeral=True)
-                
+
         except Exception as e:
-            await interaction.followup.send(f"🔴 **Erro na criação:**\n`{e}`", ephemeral=True)
+            logging.error(f"Erro na criação do card: {e}", exc_info=True)
+            try:
+                await self.interaction.followup.send(f"🔴 **Erro na criação:**\n`{e}`", ephemeral=True)
+            except discord.HTTPException:
+                pass
             # Re-habilita os botões em caso de erro para que o usuário possa tentar novamente
-            for item in self.children:
+            for item in self.view.children:
                 item.disabled = False
-            await interaction.edit_original_response(content="Ocorreu um erro. Tente novamente.", view=self)
+            await self._report("Ocorreu um erro. Tente novamente.", view=self.view)
+            return
+
+        if self.stream_summary:
+            await self._write_streamed_summary(response['id'], snapshot, total)
+
+    async def _write_streamed_summary(self, page_id: str, snapshot: ThreadSnapshot, card_elapsed: float):
+        """Escreve o resumo da IA na página já criada, logo abaixo do título da seção."""
+        started_at = time.monotonic()
+        last_written_id = None
+
+        def remember_last_written(block_id: str):
+            nonlocal last_written_id
+            last_written_id = block_id
+
+        try:
+            summary_text = await self.notion.append_streamed_text(
+                page_id, get_summarizer(self.config).stream(snapshot.messages), after_index=0,
+                on_append=remember_last_written)
+            elapsed = time.monotonic() - started_at
+            logging.info("Resumo da IA escrito no card %s em %.1fs.", page_id, elapsed)
+            status = f"resumo da IA escrito em {elapsed:.1f}s" if summary_text.strip() else "nenhuma mensagem para resumir"
+            await self._report(f"✅ Card criado em {card_elapsed:.1f}s; {status}.")
+        except Exception as e:
+            logging.error(f"Erro ao escrever o resumo da IA no card {page_id}: {e}", exc_info=True)
+            try:
+                # O aviso vem depois do trecho do resumo que já foi escrito (ou logo abaixo do título)
+                await self.notion.append_streamed_text(
+                    page_id, _single_chunk(f"⚠️ O resumo da IA não pôde ser concluído: {e}"),
+                    after_index=0, after_id=last_written_id)
+            except Exception:
+                pass
+            await self._report(f"✅ Card criado em {card_elapsed:.1f}s, mas o resumo da IA falhou: `{e}`")
 
 class CardModal(discord.ui.Modal):
 
-    def __init__(self, notion: NotionIntegration, config: dict,
+    def __init__(self, notion: AsyncNotionIntegration, config: dict,
                  all_properties: list, text_props: list, select_props: list,
                  thread_context: Optional[discord.Thread],
                  topic_title: Optional[str]):
@@ -947,9 +1117,31 @@ class TopicLinkView(View):
         self.add_item(select)
 
 
+class HistoryLimitModal(Modal, title="Histórico do Resumo"):
+    """Modal para definir quantas mensagens do tópico são lidas para o resumo e os anexos."""
+    limit_input = TextInput(
+        label="Máximo de mensagens lidas por tópico",
+        style=discord.TextStyle.short,
+        required=True,
+        max_length=6)
+
+    def __init__(self, guild_id: int, channel_id: int, config: dict):
+        super().__init__(timeout=300.0)
+        self.guild_id, self.channel_id, self.config = guild_id, channel_id, config
+        self.limit_input.default = str(history_limit(config) or "")
+
+    async def on_submit(self, interaction: Interaction):
+        value = self.limit_input.value.strip()
+        if not value.isdigit() or int(value) <= 0:
+            return await interaction.response.send_message("❌ Informe um número inteiro maior que zero.", ephemeral=True)
+        save_config(self.guild_id, self.channel_id, {'thread_history_limit': int(value)})
+        self.config['thread_history_limit'] = int(value)
+        await interaction.response.send_message(f"✅ Até **{value}** mensagens de cada tópico serão lidas para o resumo.", ephemeral=True)
+
+
 class ManagementView(View):
     """View principal de gerenciamento, agora com o botão de notificações."""
-    def __init__(self, parent_interaction: Interaction, notion: NotionIntegration, config: dict):
+    def __init__(self, parent_interaction: Interaction, notion: AsyncNotionIntegration, config: dict):
         super().__init__(timeout=300.0)
         self.parent_interaction = parent_interaction
         self.guild_id = parent_interaction.guild_id
@@ -980,25 +1172,75 @@ class ManagementView(View):
 
     @discord.ui.button(label="Resumir com IA", style=ButtonStyle.secondary, emoji="✨", row=1)
     async def manage_ai_summary(self, interaction: Interaction, button: Button):
-        is_enabled = self.config.get('ai_summary_enabled', False)
+        current = get_summarizer(self.config)
+        choice_view = View(timeout=60.0)
+
+        def make_callback(new_state):
+            async def choice_callback(inter: Interaction):
+                save_config(self.guild_id, self.channel_id, {'ai_summary_enabled': new_state})
+                self.config['ai_summary_enabled'] = new_state
+                status = f"ATIVADO ({SUMMARIZERS[new_state].label})" if new_state else "DESATIVADO"
+                await inter.response.edit_message(content=f"✅ O resumo com IA foi {status}.", view=None)
+            return choice_callback
+
+        for summarizer in SUMMARIZERS.values():
+            choice_button = Button(label=f"Usar {summarizer.label}", style=ButtonStyle.success,
+                                   disabled=current is summarizer)
+            choice_button.callback = make_callback(summarizer.name)
+            choice_view.add_item(choice_button)
+        if current:
+            disable_button = Button(label="Desativar Resumo por IA", style=ButtonStyle.danger)
+            disable_button.callback = make_callback(False)
+            choice_view.add_item(disable_button)
+        status = f"ATIVADO ({current.label})" if current else "DESATIVADO"
+        await interaction.response.send_message(f"O resumo por IA está **{status}**.", view=choice_view, ephemeral=True)
+
+    @discord.ui.button(label="Resumo Progressivo", style=ButtonStyle.secondary, emoji="✍️", row=1)
+    async def manage_ai_summary_streaming(self, interaction: Interaction, button: Button):
+        is_enabled = self.config.get('ai_summary_streaming', False)
         toggle_view = View(timeout=60.0)
-        button_label = "Desativar Resumo por IA" if is_enabled else "Ativar Resumo por IA"
+        button_label = "Desativar Resumo Progressivo" if is_enabled else "Ativar Resumo Progressivo"
         toggle_button = Button(label=button_label, style=ButtonStyle.danger if is_enabled else ButtonStyle.success)
 
         async def toggle_callback(inter: Interaction):
             new_state = not is_enabled
-            save_config(self.guild_id, self.channel_id, {'ai_summary_enabled': new_state})
-            self.config['ai_summary_enabled'] = new_state
-            await inter.response.edit_message(content=f"✅ O resumo com IA foi {'ATIVADO' if new_state else 'DESATIVADO'}.", view=None)
-            
+            save_config(self.guild_id, self.channel_id, {'ai_summary_streaming': new_state})
+            self.config['ai_summary_streaming'] = new_state
+            await inter.response.edit_message(content=f"✅ O resumo progressivo foi {'ATIVADO' if new_state else 'DESATIVADO'}.", view=None)
+
         toggle_button.callback = toggle_callback
         toggle_view.add_item(toggle_button)
-        await interaction.response.send_message(f"O resumo por IA está **{'ATIVADO' if is_enabled else 'DESATIVADO'}**.", view=toggle_view, ephemeral=True)
+        await interaction.response.send_message(f"O resumo progressivo (card criado na hora, resumo da IA escrito na página em seguida) está **{'ATIVADO' if is_enabled else 'DESATIVADO'}**.", view=toggle_view, ephemeral=True)
+
+    @discord.ui.button(label="Espelho Local de Busca", style=ButtonStyle.secondary, emoji="🗄️", row=1)
+    async def manage_local_mirror(self, interaction: Interaction, button: Button):
+        is_enabled = self.config.get('local_mirror_enabled', False)
+        toggle_view = View(timeout=60.0)
+        button_label = "Desativar Espelho Local" if is_enabled else "Ativar Espelho Local"
+        toggle_button = Button(label=button_label, style=ButtonStyle.danger if is_enabled else ButtonStyle.success)
+
+        async def toggle_callback(inter: Interaction):
+            new_state = not is_enabled
+            save_config(self.guild_id, self.channel_id, {'local_mirror_enabled': new_state})
+            self.config['local_mirror_enabled'] = new_state
+            mirror = self.notion.mirror
+            if mirror:
+                mirror.refresh_enabled_databases()
+                database_id = self.notion.extract_database_id(self.config['notion_url'])
+                if new_state and database_id and not mirror.is_ready(database_id):
+                    # A primeira sincronização (completa) roda em segundo plano; se o laço
+                    # periódico já estiver sincronizando a base, esta aguarda e só completa o delta
+                    run_in_background(mirror.delta_sync(self.notion, database_id))
+            await inter.response.edit_message(content=f"✅ O espelho local de busca foi {'ATIVADO' if new_state else 'DESATIVADO'}.", view=None)
+
+        toggle_button.callback = toggle_callback
+        toggle_view.add_item(toggle_button)
+        await interaction.response.send_message(f"O espelho local de busca (respostas instantâneas no `/busca`) está **{'ATIVADO' if is_enabled else 'DESATIVADO'}**.", view=toggle_view, ephemeral=True)
 
     @discord.ui.button(label="Configurar Link de Tópico", style=ButtonStyle.secondary, emoji="🔗", row=2)
     async def configure_topic_link(self, interaction: Interaction, button: Button):
         try:
-            all_props = self.notion.get_properties_for_interaction(self.config['notion_url'])
+            all_props = await self.notion.get_properties_for_interaction(self.config['notion_url'])
             compatible_props = [p for p in all_props if p['type'] in ['rich_text', 'url']]
             if not compatible_props:
                 return await interaction.response.send_message("❌ Nenhuma propriedade compatível (Texto ou URL) encontrada.", ephemeral=True)
@@ -1007,10 +1249,14 @@ class ManagementView(View):
         except Exception as e:
             await interaction.response.send_message(f"🔴 Erro ao buscar propriedades: {e}", ephemeral=True)
 
+    @discord.ui.button(label="Histórico do Resumo", style=ButtonStyle.secondary, emoji="📜", row=2)
+    async def configure_history_limit(self, interaction: Interaction, button: Button):
+        await interaction.response.send_modal(HistoryLimitModal(self.guild_id, self.channel_id, self.config))
+
     @discord.ui.button(label="Definir Dono do Card", style=ButtonStyle.secondary, emoji="👤", row=3)
     async def configure_individual_person(self, interaction: Interaction, button: Button):
         try:
-            all_props = self.notion.get_properties_for_interaction(self.config['notion_url'])
+            all_props = await self.notion.get_properties_for_interaction(self.config['notion_url'])
             people_props = [p for p in all_props if p['type'] == 'people']
             if not people_props:
                 return await interaction.response.send_message("❌ Nenhuma propriedade 'Pessoa' encontrada.", ephemeral=True)
@@ -1022,7 +1268,7 @@ class ManagementView(View):
     @discord.ui.button(label="Definir Envolvidos do Tópico", style=ButtonStyle.secondary, emoji="👥", row=3)
     async def configure_collective_person(self, interaction: Interaction, button: Button):
         try:
-            all_props = self.notion.get_properties_for_interaction(self.config['notion_url'])
+            all_props = await self.notion.get_properties_for_interaction(self.config['notion_url'])
             people_props = [p for p in all_props if p['type'] == 'people']
             if not people_props:
                 return await interaction.response.send_message("❌ Nenhuma propriedade 'Pessoa' encontrada.", ephemeral=True)
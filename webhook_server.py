@@ -1,15 +1,41 @@
 import logging
-import threading
 import asyncio
-from flask import Flask, request
+import json
+import os
+import time
+from collections import deque, OrderedDict
+from aiohttp import web
 import discord
 from discord.ext import commands  # <-- ADICIONADO AQUI
 
 # Importações dos seus módulos existentes
-from notion_integration import NotionIntegration
-from config_utils import load_config
-import json
+from notion_integration import AsyncNotionIntegration
+from config_utils import config_store
+from notification_rules import RuleEngine, render_template
+from page_snapshots import page_snapshots
+from notion_scheduler import background_priority
 import re
+from urllib.parse import unquote
+
+# Eventos do Notion que indicam mudança no schema (propriedades) de uma base de dados
+SCHEMA_CHANGE_EVENTS = {"database.schema_updated", "data_source.schema_updated"}
+# Variação no total de cards causada por cada tipo de evento de página
+COUNT_DELTA_EVENTS = {"page.created": 1, "page.undeleted": 1, "page.deleted": -1}
+
+def parse_notion_event(data: dict) -> tuple[str | None, str | None, str | None]:
+    """
+    Extrai (tipo do evento, ID da página, ID do banco de dados) do payload. Aceita tanto o
+    formato com 'page'/'database' quanto o formato de eventos do Notion ('entity'/'data.parent').
+    """
+    event_type = data.get('type')
+    page_id = data.get('page', {}).get('id')
+    database_id = data.get('database', {}).get('id')
+    entity = data.get('entity', {})
+    if not page_id and entity.get('type') == 'page':
+        page_id = entity.get('id')
+    if not database_id:
+        database_id = data.get('data', {}).get('parent', {}).get('id')
+    return event_type, page_id, database_id
 
 # Função para extrair o ID do Tópico de uma URL do Discord
 def extract_thread_id_from_url(url: str) -> int | None:
@@ -18,103 +44,381 @@ def extract_thread_id_from_url(url: str) -> int | None:
     match = re.search(r'/(\d+)$', url)
     return int(match.group(1)) if match else None
 
+class WebhookMetrics:
+    """Contadores e latências (espera na fila + processamento) das notificações."""
+    def __init__(self, window: int = 1000):
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.duplicates = 0
+        self.coalesced = 0
+        self.unwatched_skipped = 0
+        self._latencies = deque(maxlen=window)
+
+    def record_latency(self, seconds: float):
+        self.processed += 1
+        self._latencies.append(seconds)
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self._latencies)
+        def percentile(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "duplicates": self.duplicates,
+            "coalesced": self.coalesced,
+            "unwatched_skipped": self.unwatched_skipped,
+            "latency_avg_ms": round(1000 * sum(latencies) / len(latencies), 1) if latencies else 0.0,
+            "latency_p95_ms": round(1000 * percentile(0.95), 1),
+            "latency_max_ms": round(1000 * latencies[-1], 1) if latencies else 0.0,
+        }
+
+
+class RecentEventIds:
+    """IDs de eventos já recebidos (com TTL e tamanho máximo), para descartar reenvios do Notion."""
+    def __init__(self, ttl: float = 3600.0, max_size: int = 10000):
+        self.ttl, self.max_size = ttl, max_size
+        self._seen: OrderedDict[str, float] = OrderedDict()
+
+    def _expire(self, now: float, max_size: int):
+        while self._seen and (len(self._seen) > max_size or now - next(iter(self._seen.values())) >= self.ttl):
+            self._seen.popitem(last=False)
+
+    def __contains__(self, event_id: str) -> bool:
+        self._expire(time.monotonic(), self.max_size)
+        return event_id in self._seen
+
+    def add(self, event_id: str):
+        now = time.monotonic()
+        self._seen.pop(event_id, None)
+        self._expire(now, self.max_size - 1) # Abre espaço para o novo ID
+        self._seen[event_id] = now
+
+
+def merge_page_events(previous: dict, latest: dict) -> dict:
+    """
+    Junta dois eventos da mesma página: vale o mais recente, somando as propriedades alteradas.
+    Uma página criada na mesma janela continua sendo 'page.created' (salvo se foi excluída
+    em seguida), para que as regras avaliem todos os valores definidos na criação.
+    """
+    merged = {**latest, 'data': dict(latest.get('data', {}))}
+    if previous.get('type') == 'page.created' and latest.get('type') != 'page.deleted':
+        merged['type'] = 'page.created'
+    changed = list(previous.get('data', {}).get('updated_properties', []))
+    for prop_id in latest.get('data', {}).get('updated_properties', []):
+        if prop_id not in changed:
+            changed.append(prop_id)
+    if changed:
+        merged['data']['updated_properties'] = changed
+    return merged
+
+
 class WebhookServer:
-    def __init__(self, bot: commands.Bot, notion_integration: NotionIntegration): # <-- CORRIGIDO AQUI
-        self.app = Flask(__name__)
+    def __init__(self, bot: commands.Bot, notion_integration: AsyncNotionIntegration,
+                 host: str = '0.0.0.0', port: int = 8080,
+                 metrics_host: str = os.getenv("WEBHOOK_METRICS_HOST", "127.0.0.1"),
+                 metrics_port: int = int(os.getenv("WEBHOOK_METRICS_PORT", "8081")),
+                 queue_size: int = int(os.getenv("WEBHOOK_QUEUE_SIZE", "500")),
+                 workers: int = int(os.getenv("WEBHOOK_WORKERS", "4")),
+                 debounce_seconds: float = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "3"))):
         self.bot = bot
         self.notion = notion_integration
-        # Adiciona a rota que o Notion irá chamar.
-        # Note que o endpoint é assíncrono para interagir com o bot.
-        self.app.route("/notion-webhook", methods=["POST"])(self.handle_notion_webhook)
+        self.host, self.port = host, port
+        self.metrics_host, self.metrics_port = metrics_host, metrics_port
+        self._runner: web.AppRunner | None = None
+        self._metrics_runner: web.AppRunner | None = None
+        # Fila limitada: rajadas de eventos são processadas por um número fixo de workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.worker_count = workers
+        self._workers: list[asyncio.Task] = []
+        self.metrics = WebhookMetrics()
+        self.rule_engine = RuleEngine()
+        self.page_snapshots = page_snapshots
+        # Deduplicação por ID do evento e janela de agrupamento por página
+        self.recent_event_ids = RecentEventIds()
+        self.debounce_seconds = debounce_seconds
+        self._pending_pages: dict[str, tuple[float, dict]] = {}
+        # Servidor HTTP assíncrono (aiohttp) rodando no mesmo event loop do bot
+        self.app = web.Application()
+        self.app.router.add_post("/notion-webhook", self.handle_notion_webhook)
+        # As métricas ficam em um servidor à parte, acessível apenas localmente (por padrão)
+        self.metrics_app = web.Application()
+        self.metrics_app.router.add_get("/metrics", self.handle_metrics)
 
-    def run(self):
-        """Roda o servidor Flask em uma thread separada para não bloquear o bot."""
-        threading.Thread(target=lambda: self.app.run(host='0.0.0.0', port=8080), daemon=True).start()
-        logging.info("Servidor de Webhook iniciado na porta 8080.")
+    async def start(self):
+        """Inicia o servidor de webhooks no event loop do bot (chamadas repetidas são ignoradas)."""
+        if self._runner:
+            return
+        self._workers = [asyncio.create_task(self._worker(), name=f"webhook-worker-{i}")
+                         for i in range(self.worker_count)]
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logging.info(f"Servidor de Webhook iniciado na porta {self.port}.")
+        self._metrics_runner = web.AppRunner(self.metrics_app)
+        await self._metrics_runner.setup()
+        await web.TCPSite(self._metrics_runner, self.metrics_host, self.metrics_port).start()
+        logging.info(f"Métricas do webhook disponíveis em http://{self.metrics_host}:{self.metrics_port}/metrics.")
 
-    def find_config_for_database(self, database_id: str) -> dict | None:
-        """Encontra a configuração de canal correspondente a um ID de banco de dados do Notion."""
-        try:
-            with open('configs.json', 'r', encoding='utf-8') as f:
-                all_configs = json.load(f)
-            
-            for server_id, server_config in all_configs.items():
-                for channel_id, channel_config in server_config.get("channels", {}).items():
-                    if 'notion_url' not in channel_config:
-                        continue
-                    db_id_from_url = self.notion.extract_database_id(channel_config['notion_url'])
-                    if db_id_from_url == database_id:
-                        # Retorna a config e adiciona os IDs para uso posterior
-                        channel_config['guild_id'] = server_id
-                        channel_config['channel_id'] = channel_id
-                        return channel_config
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            logging.error(f"Erro ao ler configs.json: {e}")
-            return None
-        return None
+    async def stop(self):
+        """Para de aceitar eventos, encerra o servidor HTTP e os workers."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._metrics_runner:
+            await self._metrics_runner.cleanup()
+            self._metrics_runner = None
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self):
+        """Consome a fila de notificações, uma de cada vez."""
+        while True:
+            enqueued_at, data = await self.queue.get()
+            try:
+                with background_priority():
+                    await self.process_notification(data)
+            finally:
+                self.metrics.record_latency(time.monotonic() - enqueued_at)
+                self.queue.task_done()
+
+    def find_configs_for_database(self, database_id: str) -> list[dict]:
+        """Retorna as configurações de todos os canais inscritos em um banco de dados do Notion."""
+        return config_store.get_for_database(database_id)
 
     async def process_notification(self, data: dict):
         """Função assíncrona que processa a lógica da notificação."""
         try:
+            # 0. Mudanças de schema apenas invalidam o cache de propriedades
+            if data.get('type') in SCHEMA_CHANGE_EVENTS:
+                entity_id = data.get('entity', {}).get('id')
+                parent_id = data.get('data', {}).get('parent', {}).get('id')
+                for changed_id in (entity_id, parent_id):
+                    if changed_id:
+                        self.notion.invalidate_schema(changed_id)
+                logging.info(f"Schema do database {entity_id} alterado; cache de propriedades invalidado.")
+                return
+
             # 1. Extrair IDs do payload do Notion
-            page_id = data.get('page', {}).get('id')
-            database_id = data.get('database', {}).get('id')
+            event_type, page_id, database_id = parse_notion_event(data)
 
             if not page_id or not database_id:
                 logging.warning("Webhook recebido sem ID de página ou de banco de dados.")
                 return
 
-            # 2. Encontrar a configuração do bot para este banco de dados
-            config = self.find_config_for_database(database_id)
-            if not config:
+            # Mantém o espelho local (busca offline) atualizado
+            page_details = None
+            mirror = self.notion.mirror
+            if mirror and self.notion.extract_database_id(database_id) in mirror.enabled_databases:
+                if event_type == 'page.deleted':
+                    await mirror.remove_page(page_id)
+                else:
+                    page_details = await self.notion.get_page(page_id)
+                    await mirror.upsert_page(self.notion.extract_database_id(database_id), page_details)
+
+            # 2. Encontrar as configurações de todos os canais ligados a este banco de dados
+            configs = self.find_configs_for_database(database_id)
+            if not configs:
                 logging.info(f"Nenhuma configuração encontrada para o database {database_id}.")
                 return
 
-            # 3. Lógica da Notificação em Tópico
-            if config.get("topic_notifications_enabled"):
-                logging.info(f"Processando notificação de tópico para a página {page_id}")
-                
-                # Pega o nome da propriedade que armazena o link do tópico
-                topic_prop_name = config.get('topic_link_property_name')
-                if not topic_prop_name:
-                    logging.warning(f"Notificação de tópico habilitada, mas nenhuma propriedade de link definida para o canal {config['channel_id']}.")
-                    return
+            # 3. Lógica da Notificação em Tópico (a página é buscada uma única vez para todos os canais)
+            for config in configs:
+                if not config.get("topic_notifications_enabled"):
+                    continue
+                if page_details is None:
+                    page_details = await self.notion.get_page(page_id)
+                await self.notify_topic(config, page_id, page_details)
 
-                # Busca os dados atualizados da página no Notion
-                page_details = self.notion.get_page(page_id)
-                page_properties = page_details.get('properties', {})
-                
-                # Extrai a URL do tópico da propriedade correta
-                topic_link_prop = page_properties.get(topic_prop_name)
-                if not topic_link_prop:
-                    return 
-
-                topic_url = self.notion.extract_value_from_property(topic_link_prop, topic_link_prop['type'])
-                thread_id = extract_thread_id_from_url(topic_url)
-
-                if thread_id:
-                    # Tenta obter o canal (tópico) no Discord
-                    thread = self.bot.get_channel(thread_id) or await self.bot.fetch_channel(thread_id)
-                    
-                    if thread:
-                        display_props = config.get('display_properties', [])
-                        embed = self.notion.format_page_for_embed(page_details, display_props)
-                        
-                        await thread.send("🔔 **Card Atualizado no Notion!**", embed=embed)
-                        logging.info(f"Notificação enviada para o tópico {thread_id}.")
-                    else:
-                        logging.warning(f"Não foi possível encontrar o tópico com ID {thread_id}.")
-            
-            # TODO: Implementar lógica para "Canal Fixo" e "DM" aqui, se desejar.
+            # 4. Regras de notificação configuradas pelo assistente (Tópico, Canal Fixo e DM).
+            #    Só disparam em transições reais das propriedades gatilho, comparando com o snapshot.
+            normalized_db_id = self.notion.extract_database_id(database_id)
+            watched = self.rule_engine.trigger_properties(normalized_db_id)
+            if event_type == 'page.deleted':
+                self.page_snapshots.remove(page_id)
+            elif watched:
+                changed = await self._changed_property_names(normalized_db_id, data, event_type, watched)
+                if changed is not None and not changed:
+                    self.metrics.unwatched_skipped += 1
+                    logging.debug(f"Evento da página {page_id} não altera propriedades observadas por regras.")
+                    return
+                if page_details is None:
+                    page_details = await self.notion.get_page(page_id)
+                values = self.rule_engine.watched_values(normalized_db_id, page_details, self.notion)
+                transitions = self.page_snapshots.diff(page_id, values, changed)
+                for rule, config, trigger_value in self.rule_engine.match_values(normalized_db_id, transitions):
+                    await self.dispatch_rule(rule, config, page_details, trigger_value)
 
         except Exception as e:
             logging.error(f"Erro ao processar webhook do Notion: {e}", exc_info=True)
 
-    async def handle_notion_webhook(self):
+    async def _changed_property_names(self, database_id: str, data: dict, event_type: str,
+                                      watched: list[str]) -> set[str] | None:
+        """
+        Nomes das propriedades observadas que o evento declara ter alterado. Retorna None
+        quando o evento não traz essa informação (formato antigo ou schema indisponível).
+        """
+        if event_type == 'page.created':
+            return set(watched)
+        updated_ids = data.get('data', {}).get('updated_properties')
+        if updated_ids is None:
+            return None
+        try:
+            schema = await self.notion.get_database_properties(database_id)
+        except Exception as e:
+            logging.warning(f"Schema do database {database_id} indisponível para filtrar o evento: {e}")
+            return None
+        updated_ids = {unquote(prop_id) for prop_id in updated_ids}
+        return {prop_name for prop_name in watched
+                if unquote(schema.get(prop_name, {}).get('id', '')) in updated_ids}
+
+    async def _get_topic_thread(self, config: dict, page_details: dict):
+        """Retorna o tópico do Discord cujo link está salvo no card, se houver."""
+        topic_prop_name = config.get('topic_link_property_name')
+        if not topic_prop_name:
+            return None
+        topic_link_prop = page_details.get('properties', {}).get(topic_prop_name)
+        if not topic_link_prop:
+            return None
+        topic_url = self.notion.extract_value_from_property(topic_link_prop, topic_link_prop['type'])
+        thread_id = extract_thread_id_from_url(topic_url)
+        if not thread_id:
+            return None
+        # Tenta obter o canal (tópico) no Discord
+        return self.bot.get_channel(thread_id) or await self.bot.fetch_channel(thread_id)
+
+    async def notify_topic(self, config: dict, page_id: str, page_details: dict):
+        """Envia o embed do card atualizado no tópico salvo na página."""
+        try:
+            logging.info(f"Processando notificação de tópico para a página {page_id}")
+
+            if not config.get('topic_link_property_name'):
+                logging.warning(f"Notificação de tópico habilitada, mas nenhuma propriedade de link definida para o canal {config['channel_id']}.")
+                return
+
+            thread = await self._get_topic_thread(config, page_details)
+            if thread:
+                display_props = config.get('display_properties', [])
+                embed = self.notion.format_page_for_embed(page_details, display_props)
+
+                await thread.send("🔔 **Card Atualizado no Notion!**", embed=embed)
+                logging.info(f"Notificação enviada para o tópico {thread.id}.")
+            else:
+                logging.warning(f"Não foi possível encontrar o tópico da página {page_id}.")
+        except Exception as e:
+            logging.error(f"Erro ao notificar o canal {config.get('channel_id')}: {e}", exc_info=True)
+
+    async def dispatch_rule(self, rule: dict, config: dict, page_details: dict, trigger_value: str):
+        """Executa a ação de uma regra de notificação satisfeita pelo card."""
+        try:
+            embed = self.notion.format_page_for_embed(page_details, config.get('display_properties', []))
+            title_prop = next((prop for prop in page_details.get('properties', {}).values() if prop.get('type') == 'title'), None)
+            card_title = (self.notion.extract_value_from_property(title_prop, 'title') if title_prop else None) or "Card sem título"
+            message = render_template(rule.get('message_template', ''), card_title, trigger_value)
+            action_type = rule.get('action_type')
+
+            if action_type == 'send_to_topic':
+                thread = await self._get_topic_thread(config, page_details)
+                if not thread:
+                    return logging.warning(f"Regra {rule.get('rule_id')}: card sem tópico vinculado.")
+                await thread.send(message, embed=embed)
+
+            elif action_type == 'send_to_channel':
+                channel_id = int(config['channel_id'])
+                channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+                await channel.send(message, embed=embed)
+
+            elif action_type == 'dm_responsible':
+                people_prop = page_details.get('properties', {}).get(rule.get('responsible_person_prop'), {})
+                people_mapping = self.notion.people_mapping
+                for person in people_prop.get('people', []):
+                    discord_id = people_mapping.get_discord_id(person.get('id')) if people_mapping else None
+                    if not discord_id:
+                        logging.info(f"Regra {rule.get('rule_id')}: usuário do Notion {person.get('id')} sem vínculo no Discord.")
+                        continue
+                    user = self.bot.get_user(discord_id) or await self.bot.fetch_user(discord_id)
+                    await user.send(message, embed=embed)
+            else:
+                return logging.warning(f"Regra {rule.get('rule_id')} com ação desconhecida: {action_type}.")
+
+            logging.info(f"Regra {rule.get('rule_id')} ({action_type}) executada para o canal {config.get('channel_id')}.")
+        except Exception as e:
+            logging.error(f"Erro ao executar a regra {rule.get('rule_id')}: {e}", exc_info=True)
+
+    async def handle_notion_webhook(self, request: web.Request) -> web.Response:
         """Endpoint que recebe a chamada do Notion."""
-        if request.method == 'POST':
-            # Delega o processamento para uma função async que pode interagir com o bot
-            # Usa run_coroutine_threadsafe para chamar código async de uma thread sync (Flask)
-            asyncio.run_coroutine_threadsafe(self.process_notification(request.json), self.bot.loop)
-            return "OK", 200
-        return "Método não permitido", 405
\ No newline at end of file
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            return web.Response(status=400, text="JSON inválido")
+
+        # Reenvios do mesmo evento são descartados
+        event_id = data.get('id')
+        if event_id and event_id in self.recent_event_ids:
+            self.metrics.duplicates += 1
+            return web.Response(text="OK")
+
+        event_type, page_id, database_id = parse_notion_event(data)
+
+        # Eventos de uma página que já aguarda na janela de agrupamento são apenas mesclados
+        if page_id and page_id in self._pending_pages:
+            received_at, pending = self._pending_pages[page_id]
+            self._pending_pages[page_id] = (received_at, merge_page_events(pending, data))
+            self._apply_count_delta(event_type, database_id)
+            if event_id: self.recent_event_ids.add(event_id)
+            self.metrics.accepted += 1
+            self.metrics.coalesced += 1
+            return web.Response(text="OK")
+
+        # Sem vaga, o evento é recusado antes de ser confirmado (e sem registrar o ID),
+        # para que o Notion o reenvie
+        if not self._has_room():
+            self.metrics.rejected += 1
+            logging.warning("Fila de webhooks cheia; evento rejeitado.")
+            return web.Response(status=503, text="Fila cheia", headers={"Retry-After": "5"})
+
+        self._apply_count_delta(event_type, database_id)
+        if event_id: self.recent_event_ids.add(event_id)
+        self.metrics.accepted += 1
+        if page_id and self.debounce_seconds > 0 and data.get('type') not in SCHEMA_CHANGE_EVENTS:
+            # Rajadas de eventos da mesma página viram um único processamento
+            self._pending_pages[page_id] = (time.monotonic(), data)
+            asyncio.get_running_loop().call_later(self.debounce_seconds, self._release_page, page_id)
+        else:
+            self.queue.put_nowait((time.monotonic(), data))
+        return web.Response(text="OK")
+
+    def _has_room(self) -> bool:
+        """
+        Indica se há vaga para um novo evento. Páginas aguardando na janela de agrupamento
+        já reservaram a sua vaga na fila, então contam para o limite: assim, ao fim da
+        janela, o evento sempre cabe na fila e nunca é descartado depois de confirmado.
+        """
+        return not self.queue.maxsize or self.queue.qsize() + len(self._pending_pages) < self.queue.maxsize
+
+    def _release_page(self, page_id: str):
+        """Fim da janela de agrupamento: envia o evento mesclado da página para a fila (vaga já reservada)."""
+        received_at, data = self._pending_pages.pop(page_id)
+        self.queue.put_nowait((received_at, data))
+
+    def _apply_count_delta(self, event_type: str | None, database_id: str | None):
+        """Mantém a contagem de cards (/num_cards) sem precisar recontar a base."""
+        if database_id and (delta := COUNT_DELTA_EVENTS.get(event_type)):
+            self.notion.count_cache.adjust(self.notion.extract_database_id(database_id), delta)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """Expõe o estado da fila, as latências e as estatísticas do cache de schema."""
+        return web.json_response({
+            "queue_depth": self.queue.qsize(),
+            "queue_max_size": self.queue.maxsize,
+            "pending_pages": len(self._pending_pages),
+            "workers": self.worker_count,
+            **self.metrics.snapshot(),
+            "schema_cache": self.notion.schema_cache.stats(),
+            "notion_scheduler": self.notion.scheduler.stats(),
+            "notion_single_flight": self.notion.notion.single_flight.stats(),
+        })